@@ -2,20 +2,44 @@
 
 import bpy
 import re
+import os
+import sys
+import time
+import array
+import hashlib
+import site
+import importlib
+import contextlib
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+import mathutils
+import mathutils.kdtree
 
 from . import shared_functions
+from . import instance_detection
+from . import descriptor_cache
 
 
 
-# Assign linkable collection.
+# Assign linkable collection. The members are kept in the bin store (see
+# Bin Store below), the list only shows one page of thin items.
 class LinkableCollectionItem(bpy.types.PropertyGroup):
     name: bpy.props.StringProperty(name='Items Name', default='Unknown')
-    objects: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup, name='Linkable Objects')
+    bin_index: bpy.props.IntProperty(name='Bin Index', default=-1)
     N_objects: bpy.props.IntProperty(name='Number of Objects', default=0)
     selected: bpy.props.BoolProperty(name='Selected', default=False)
 
+def ListPageCallback(self, context):
+    refresh_linkable_collections(self)
+
+# set while the list index is clamped by code, so the selection is kept
+_suppress_index_callback = False
+
 def ListIndexCallback(self, value):
     # bpy.ops.generate_markers.change_marker() #other class function
+    if _suppress_index_callback:
+        return
     try:
         bpy.ops.object.list_select_collection()
     except:
@@ -33,8 +57,10 @@ class LIST_OT_SelectCollection(bpy.types.Operator):
         linkable_collections = context.scene.linkable_collections
         index = context.scene.lin_col_idx
 
-        name = linkable_collections[index].name
-        objects = [bpy.data.objects[o.name] for o in list(linkable_collections[index].objects)]
+        if not 0 <= index < len(linkable_collections):
+            return {'CANCELLED'}
+        objects_index = object_index()
+        objects = [obj for obj, _ in bin_members(get_bin(context.scene, linkable_collections[index]), objects_index)]
 
         bpy.ops.object.select_all(action='DESELECT')
         # context.view_layer.objects.active = None
@@ -45,14 +71,10 @@ class LIST_OT_SelectCollection(bpy.types.Operator):
         return{'FINISHED'}
     
 class LIST_OT_LinkCollection(bpy.types.Operator):
-    '''Link selected collection of objects to the same mesh data.'''
+    '''Link selected collection of objects to the same mesh data or replace them by instances.'''
     bl_idname = "object.list_link_collection"
     bl_label = "Link Collection"
-
-    _indices_to_link = None
-    _step = 0
-    _total = 0
-    _undo_state = None
+    bl_options = {"REGISTER", "UNDO"}
 
     @classmethod
     def poll(cls, context):
@@ -60,67 +82,154 @@ class LIST_OT_LinkCollection(bpy.types.Operator):
 
     def execute(self, context):
         linkable_collections = context.scene.linkable_collections
-        self._indices_to_link = [i for i, item in enumerate(linkable_collections) if item.selected]
-        if not self._indices_to_link:
-            self._indices_to_link = [context.scene.lin_col_idx]
-        self._indices_to_link.sort(reverse=True)
-        self._step = 0
-        self._total = len(self._indices_to_link)
-        context.window_manager.progress_begin(0, self._total)
-        context.window_manager.modal_handler_add(self)
-        return {'RUNNING_MODAL'}
+        indices_to_link = [i for i, item in enumerate(linkable_collections) if item.selected]
+        if not indices_to_link:
+            indices_to_link = [context.scene.lin_col_idx]
+        indices_to_link = [i for i in indices_to_link if 0 <= i < len(linkable_collections)]
 
-    def modal(self, context, event):
-        linkable_collections = context.scene.linkable_collections
-        if self._step < self._total:
-            idx = self._indices_to_link[self._step]
-            item = linkable_collections[idx]
-            objects = [bpy.data.objects[o.name] for o in list(item.objects)]
-            if objects:
-                first_data = objects[0].data
-                # Batch assignment
-                for obj in objects[1:]:
-                    obj.data = first_data
-            linkable_collections.remove(idx)
-            context.window_manager.progress_update(self._step)
-            self._step += 1
-            return {'RUNNING_MODAL'}
-        context.window_manager.progress_end()
-        context.scene.lin_col_idx = min(max(0, context.scene.lin_col_idx-1), len(linkable_collections)-1)
+        objects_index = object_index()
+        bins = [get_bin(context.scene, linkable_collections[i]) for i in indices_to_link]
+        bins = [b for b in bins if bin_is_linkable(b, objects_index)]
+        if not bins:
+            shared_functions.report_info(self, "Nothing left to link in the selected collections")
+            return {'CANCELLED'}
+        method = context.scene.cad_link_method
+        if method == 'DATA':
+            result = link_collection_items(bins)
+        else:
+            result = instance_collection_items(bins, method, context)
+        # drop the linked bins from the store and the list
+        prune_bins(context.scene, bins)
+        refresh_linkable_collections(context.scene)
+        if method == 'DATA':
+            report_link_result(self, len(bins), result)
+        else:
+            report_instance_result(self, len(bins), result)
         return {'FINISHED'}
 
 
 class LIST_OT_LinkALLCollections(bpy.types.Operator):
-    '''Link all collections of objects to the same mesh data.'''
+    '''Link all collections of objects to the same mesh data or replace them by instances.'''
     bl_idname = "object.link_all_collections"
     bl_label = "Link All Collections"
+    bl_options = {"REGISTER", "UNDO"}
 
 
     @classmethod
     def poll(cls, context):
-        return context.scene.linkable_collections
+        return get_bins(context.scene)
 
     def execute(self, context):
-        linkable_collections = context.scene.linkable_collections
-        indices_to_link = list(range(len(linkable_collections)))
-        indices_to_link.sort(reverse=True)
-        total = len(indices_to_link)
-        context.window_manager.progress_begin(0, total)
-        linked_count = 0
-        for step, idx in enumerate(indices_to_link):
-            if idx < len(linkable_collections):
-                item = linkable_collections[idx]
-                objects = [bpy.data.objects[o.name] for o in list(item.objects)]
-                if objects:
-                    first_data = objects[0].data
-                    for obj in objects[1:]:
-                        obj.data = first_data
-                linkable_collections.remove(idx)
-                linked_count += 1
-            context.window_manager.progress_update(step)
-        context.window_manager.progress_end()
-        context.scene.lin_col_idx = min(max(0, context.scene.lin_col_idx-1), len(linkable_collections)-1)
-        self.report({'INFO'}, f'Linked {linked_count} collections')
+        bins = prune_bins(context.scene)
+        linked_count = len(bins)
+        if not bins:
+            shared_functions.report_info(self, "Nothing left to link")
+            return {'CANCELLED'}
+        method = context.scene.cad_link_method
+        if method == 'DATA':
+            result = link_collection_items(bins)
+        else:
+            result = instance_collection_items(bins, method, context)
+        prune_bins(context.scene, bins)
+        show_page(context.scene, 0)
+        if method == 'DATA':
+            report_link_result(self, linked_count, result)
+        else:
+            report_instance_result(self, linked_count, result)
+        return {'FINISHED'}
+
+
+class InstanceIdenticalAssemblies(bpy.types.Operator):
+    '''Find identical sub-assemblies (empties with their children) below the selection and replace them by collection instances.'''
+    bl_idname = "object.instance_identical_assemblies"
+    bl_label = "Instance Identical Assemblies"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT' and context.selected_objects
+
+    def execute(self, context):
+        groups = find_identical_assemblies(context.selected_objects, context.scene)
+        if not groups:
+            shared_functions.report_info(self, 'No identical sub-assemblies found')
+            return {'CANCELLED'}
+        instanced, removed, freed, freed_bytes = instance_assemblies(groups, context)
+        shared_functions.report_info(
+            self,
+            f'Instanced {instanced} sub-assemblies of {len(groups)} kinds: removed {removed} objects, '
+            f'freed {freed} data-blocks (~{freed_bytes / 1024 ** 2:.1f} MB)',
+            )
+        return {'FINISHED'}
+
+
+class FindSimilarParts(bpy.types.Operator):
+    '''Select the objects whose shape is most similar to the active object (extents, surface and shape distribution, in any pose)'''
+    bl_idname = "object.find_similar_parts"
+    bl_label = "Find Similar Parts"
+    bl_options = {"REGISTER", "UNDO"}
+
+    count: bpy.props.IntProperty(
+        name="Count",
+        description="Number of most similar parts to select",
+        default=10,
+        min=1,
+        soft_max=100)
+    scope: bpy.props.EnumProperty(
+        name="Search In",
+        items=[
+            ('SCENE', "Scene", "Search all objects of the scene"),
+            ('SELECTION', "Selection", "Search the selected objects"),
+        ],
+        default='SCENE')
+    use_size: bpy.props.BoolProperty(
+        name="Match Size",
+        description="Rank parts of another size lower (e.g. bolts of another length); otherwise only the shape counts",
+        default=True)
+
+    @classmethod
+    def poll(cls, context):
+        return (
+            context.mode == 'OBJECT'
+            and context.active_object is not None
+            and instance_detection.np is not None
+            )
+
+    def execute(self, context):
+        active = context.active_object
+        if self.scope == 'SELECTION':
+            objects = list(context.selected_objects)
+            if active not in objects:
+                objects.append(active)
+        else:
+            objects = list(context.scene.objects)
+        objects = [ob for ob in objects if ob.type == 'MESH' or ob.type in _EVALUATED_TYPES]
+
+        rows, row_uids, row_of = get_similarity_index(objects, context.scene)
+        if active.session_uid not in row_of:
+            shared_functions.report_warning(self, f'"{active.name}" has no geometry to compare')
+            return {'CANCELLED'}
+        weights = instance_detection.np.ones(instance_detection.SHAPE_COLUMNS)
+        if not self.use_size:
+            weights[instance_detection.SHAPE_SIZE_COLUMN] = 0.0
+        # the active part itself is the nearest row
+        nearest, distances = instance_detection.nearest_rows(rows, rows[row_of[active.session_uid]], self.count + 1, weights)
+
+        objects_index = object_index()
+        bpy.ops.object.select_all(action='DESELECT')
+        selected = 0
+        for row in nearest:
+            for uid in row_uids[row]:
+                ob = objects_index.get(uid)
+                if ob is not None and ob.visible_get():
+                    ob.select_set(True)
+                    selected += 1
+        context.view_layer.objects.active = active
+        shared_functions.report_info(
+            self,
+            f'Selected {selected} objects of the {len(nearest) - 1} parts most similar to "{active.name}" '
+            f'(distance up to {max(distances, default=0.0):.2f})',
+            )
         return {'FINISHED'}
 
 
@@ -152,13 +261,22 @@ class UIListPanelLinkableCollection(bpy.types.Panel):
         obj = context.object
 
         row = layout.row()
+        row.prop(scene, 'cad_detect_mode', expand=True)
+        row = layout.row(align=True)
         row.operator(
             'object.refresh_linkable_collection',
-            text=f'Rescan Selection',
+            text='Rescan File' if scene.cad_detect_scope == 'FILE' else 'Rescan Selection',
             icon='FILE_REFRESH'
             )
+        row.prop(scene, 'cad_detect_scope', text='')
 
         layout.template_list('LINKABLE_COLLECTION_UL_LIST', 'a list', scene, 'linkable_collections', scene, 'lin_col_idx')
+        n_pages = page_count(scene)
+        if n_pages > 1:
+            row = layout.row()
+            row.prop(scene, 'lin_col_page', text=f'Page (of {n_pages})')
+        row = layout.row()
+        row.prop(scene, 'cad_link_method', text='')
         row = layout.row()
         row.operator(
             'object.list_link_collection',
@@ -167,10 +285,24 @@ class UIListPanelLinkableCollection(bpy.types.Panel):
             )
         row.operator(
             'object.link_all_collections',
-            text=f'Link all {len(context.scene.linkable_collections)} collections',
+            text=f'Link all {len(get_bins(scene))} collections',
             icon='LINKED'
             )
 
+        layout.separator()
+        row = layout.row()
+        row.operator(
+            'object.instance_identical_assemblies',
+            text='Instance Identical Assemblies',
+            icon='OUTLINER_OB_GROUP_INSTANCE'
+            )
+        row = layout.row()
+        row.operator(
+            'object.find_similar_parts',
+            text='Find Similar Parts',
+            icon='VIEWZOOM'
+            )
+
 class InstanceDetectionTolerancesPanel(bpy.types.Panel):
     bl_label = "Instance Detection Tolerances"
     bl_idname = "PANEL_PT_instance_detection_tolerances"
@@ -184,27 +316,153 @@ class InstanceDetectionTolerancesPanel(bpy.types.Panel):
     def draw(self, context):
         scene = context.scene
         layout = self.layout
-        grid = layout.grid_flow(row_major=True, columns=2, even_columns=True, even_rows=True, align=True)
-        grid.prop(scene, 'cad_bin_tol_vertex', text="Vertex Count (%)")
-        grid.prop(scene, 'cad_bin_tol_axes', text="Axes (%)")
-        grid.prop(scene, 'cad_bin_tol_surface', text="Surface (%)")
-        grid.prop(scene, 'cad_bin_tol_volume', text="Volume (%)")
+        if scene.cad_detect_mode == 'FINGERPRINT':
+            layout.prop(scene, 'cad_fingerprint_precision', text="Precision")
+        elif scene.cad_detect_mode == 'POSE':
+            layout.prop(scene, 'cad_bin_tol_axes', text="Shape (%)")
+            layout.prop(scene, 'cad_pose_tolerance', text="Match Distance")
+            layout.prop(scene, 'cad_pose_mirror', text="Mirrored Parts")
+        else:
+            grid = layout.grid_flow(row_major=True, columns=2, even_columns=True, even_rows=True, align=True)
+            grid.prop(scene, 'cad_bin_tol_vertex', text="Vertex Count (%)")
+            grid.prop(scene, 'cad_bin_tol_axes', text="Axes (%)")
+            grid.prop(scene, 'cad_bin_tol_surface', text="Surface (%)")
+            grid.prop(scene, 'cad_bin_tol_volume', text="Volume (%)")
+            row = layout.row(align=True)
+            row.prop(scene, 'cad_detect_verify', text="Verify")
+            sub = row.row(align=True)
+            sub.enabled = scene.cad_detect_verify
+            sub.prop(scene, 'cad_bin_tol_verify', text="Geometry (%)")
+
+        layout.separator()
+        row = layout.row(align=True)
+        row.prop(scene, 'cad_detect_use_processes', text="Worker Processes")
+        sub = row.row(align=True)
+        sub.enabled = scene.cad_detect_use_processes
+        sub.prop(scene, 'cad_detect_processes', text="Count")
+        row = layout.row(align=True)
+        row.prop(scene, 'cad_disk_cache', text="Disk Cache")
+        sub = row.row(align=True)
+        sub.enabled = scene.cad_disk_cache
+        sub.prop(scene, 'cad_disk_cache_mb', text="MB")
 
 class RefreshLinkableCollection(bpy.types.Operator):
-    '''Scan the selection for identical mesh objects and group them into linkable collections.'''
+    '''Scan the selection (or all meshes of the file) for identical objects and group them into linkable collections.
+    The scan runs in time-sliced batches; press ESC to cancel and keep the results found so far.'''
     bl_idname = 'object.refresh_linkable_collection'
     bl_label = 'Refresh Instance Detection & Linking'
     bl_options = {"REGISTER", "UNDO"}
-    
+
+    _objects = None
+    _stream = None
+    _index = 0
+    _total = 0
+    _timer = None
+    _wm_progress_open = False
+    _batch_size = 50
+    _batch_min = 10
+    _batch_max = 5000
+    _batch_target_seconds = 0.1
+
     def execute(self, context):
         objects = context.selected_objects
         prop_types = ['MESH', 'CURVE', 'SURFACE', 'META', 'FONT', 'VOLUME']
         objects = [ob for ob in objects if ob.type in prop_types]
 
-        # Single efficient summary and binning
-        summarize_and_bin_objects(objects, context.scene)
-        
-        return {'FINISHED'}
+        if context.scene.cad_detect_mode == 'POSE' and instance_detection.np is None:
+            shared_functions.report_error(self, 'Pose detection requires NumPy')
+            return {'CANCELLED'}
+
+        self._objects = objects
+        self._stream = None
+        if context.scene.cad_detect_scope == 'FILE':
+            if instance_detection.np is None:
+                shared_functions.report_error(self, 'Scanning the whole file requires NumPy')
+                return {'CANCELLED'}
+            self._stream = DescriptorStream(context.scene)
+        self._index = 0
+        self._total = len(self._stream) if self._stream is not None else len(objects)
+        self._batch_size = 50
+
+        wm = context.window_manager
+        if context.window is None:
+            # Fallback for non-UI execution contexts where modal timers are unavailable.
+            if self._stream is not None:
+                while self._stream.index < self._total:
+                    self._stream.step(context.scene, self._batch_max)
+            self._index = self._total
+            self._finish(context, cancelled=False)
+            return {'FINISHED'}
+
+        wm.progress_begin(0, self._total)
+        self._wm_progress_open = True
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            # partial results are kept, so the scene did change
+            self._finish(context, cancelled=True)
+            return {'FINISHED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        tick_start = time.perf_counter()
+        try:
+            if self._stream is not None:
+                self._stream.step(context.scene, self._batch_size)
+                self._index = self._stream.index
+            else:
+                batch = [ob for ob in self._objects[self._index:self._index + self._batch_size] if _is_valid(ob)]
+                compute_scan_batch(batch, context.scene)
+                self._index = min(self._total, self._index + self._batch_size)
+        except Exception as exc:
+            self._finish(context, cancelled=True)
+            shared_functions.report_error(self, f'Instance detection failed: {exc}')
+            return {'CANCELLED'}
+
+        # adapt the batch size, so every tick takes roughly the target time
+        elapsed = time.perf_counter() - tick_start
+        if elapsed < self._batch_target_seconds * 0.5:
+            self._batch_size = min(self._batch_max, self._batch_size * 2)
+        elif elapsed > self._batch_target_seconds * 1.5:
+            self._batch_size = max(self._batch_min, self._batch_size // 2)
+
+        if self._index >= self._total:
+            self._finish(context, cancelled=False)
+            return {'FINISHED'}
+
+        context.window_manager.progress_update(self._index)
+        if context.area is not None:
+            context.area.tag_redraw()
+        return {'RUNNING_MODAL'}
+
+    def _finish(self, context, cancelled):
+        wm = context.window_manager
+        if self._timer is not None:
+            wm.event_timer_remove(self._timer)
+            self._timer = None
+        if self._wm_progress_open:
+            wm.progress_end()
+            self._wm_progress_open = False
+
+        if self._stream is not None:
+            self._stream.populate(context.scene)
+            self._stream = None
+        else:
+            # descriptors of the scanned objects are cached, binning them is fast
+            scanned = [ob for ob in self._objects[:self._index] if _is_valid(ob)]
+            bin_objects(scanned, context.scene)
+
+        flush_disk_cache()
+        n_bins = len(get_bins(context.scene))
+        if cancelled:
+            unit = 'meshes' if context.scene.cad_detect_scope == 'FILE' else 'objects'
+            shared_functions.report_warning(self, f'Scan cancelled after {self._index}/{self._total} {unit}, found {n_bins} linkable collections')
+        else:
+            shared_functions.report_info(self, f'Found {n_bins} linkable collections')
 
 
 ##############################################################################
@@ -219,6 +477,8 @@ classes = (
     LIST_OT_LinkALLCollections,
     LIST_OT_SelectCollection,
     LIST_OT_LinkCollection,
+    InstanceIdenticalAssemblies,
+    FindSimilarParts,
 )
 
 def register():
@@ -229,34 +489,123 @@ def register():
 
     bpy.types.Scene.linkable_collections = bpy.props.CollectionProperty(type=LinkableCollectionItem)
     bpy.types.Scene.lin_col_idx = bpy.props.IntProperty(name='Index', update=ListIndexCallback)
+    bpy.types.Scene.lin_col_page = bpy.props.IntProperty(name='Page', default=0, min=0, update=ListPageCallback)
+    bpy.types.Scene.cad_detect_mode = bpy.props.EnumProperty(
+        name="Detection Mode",
+        description="How identical objects are detected",
+        items=[
+            ('METRICS', "Metrics", "Group objects with similar vertex count, bounding box, volume and surface (within tolerances)"),
+            ('FINGERPRINT', "Exact", "Group objects with identical vertex positions and polygons (within precision)"),
+            ('POSE', "Any Pose", "Group objects with identical geometry in any position and orientation (e.g. transforms baked into the vertices) and link them with a corrected object transform, optionally including mirror images"),
+        ],
+        default='METRICS')
+    bpy.types.Scene.cad_link_method = bpy.props.EnumProperty(
+        name="Link Method",
+        description="How the objects of a linkable collection are combined",
+        items=[
+            ('DATA', "Share Mesh Data", "Keep every object and link them to the same mesh data"),
+            ('COLLECTION', "Collection Instances", "Replace every object by an empty instancing a collection with one source object"),
+            ('POINTS', "Instance on Points", "Replace all objects by one point cloud object instancing the source object on every point with Geometry Nodes"),
+        ],
+        default='DATA')
+    bpy.types.Scene.cad_detect_scope = bpy.props.EnumProperty(
+        name="Detection Scope",
+        description="Which objects are scanned",
+        items=[
+            ('SELECTION', "Selection", "Scan the selected objects"),
+            ('FILE', "File", "Scan the meshes of all objects in the file, streamed in chunks so memory use stays flat (mesh objects only)"),
+        ],
+        default='SELECTION')
+    bpy.types.Scene.cad_fingerprint_precision = bpy.props.FloatProperty(
+        name="Fingerprint Precision",
+        description="Vertex positions are rounded to this step before comparing geometry",
+        default=1e-5,
+        min=1e-9,
+        soft_max=0.01,
+        precision=6,
+        subtype='DISTANCE')
+    bpy.types.Scene.cad_pose_tolerance = bpy.props.FloatProperty(
+        name="Pose Match Distance",
+        description="Maximum vertex distance after aligning two objects for them to count as identical",
+        default=1e-4,
+        min=0.0,
+        soft_max=0.01,
+        precision=6,
+        subtype='DISTANCE')
+    bpy.types.Scene.cad_pose_mirror = bpy.props.BoolProperty(
+        name="Link Mirrored Parts",
+        description="Also group mirror images (left- and right-hand parts) and link them with a mirrored (negative scale) object transform",
+        default=False)
+    bpy.types.Scene.cad_detect_use_processes = bpy.props.BoolProperty(
+        name="Use Worker Processes",
+        description="Compute the descriptors of large scans in parallel worker processes",
+        default=False)
+    bpy.types.Scene.cad_detect_processes = bpy.props.IntProperty(
+        name="Worker Processes",
+        description="Number of worker processes (0 uses all CPU cores)",
+        default=0,
+        min=0,
+        soft_max=64)
+    bpy.types.Scene.cad_disk_cache = bpy.props.BoolProperty(
+        name="Disk Cache",
+        description="Keep detection results in a .cad_cache file next to the .blend file, so rescans after reopening only process changed meshes",
+        default=False)
+    bpy.types.Scene.cad_disk_cache_mb = bpy.props.IntProperty(
+        name="Disk Cache Size (MB)",
+        description="Maximum size of the disk cache file; the least recently used results are evicted",
+        default=64,
+        min=1,
+        soft_max=1024)
     bpy.types.Scene.cad_bin_tol_vertex = bpy.props.FloatProperty(
         name="Vertex Count Tolerance (%)",
-        description="Maximum allowed difference in vertex count between objects, as a percent of the current bin average",
+        description="Maximum allowed difference in vertex count between objects, as a percent of the bin representative",
         default=5.0,
         min=0.0,
         max=100.0)
     bpy.types.Scene.cad_bin_tol_axes = bpy.props.FloatProperty(
         name="Principal Axes Tolerance (%)",
-        description="Maximum allowed difference for bounding-box min/max axis values (X, Y, Z), as a percent of the bin average",
+        description="Maximum allowed difference for bounding-box min/max axis values (X, Y, Z), as a percent of the bin representative",
         default=1.0,
         min=0.0,
         max=100.0)
     bpy.types.Scene.cad_bin_tol_surface = bpy.props.FloatProperty(
         name="Face Surface Tolerance (%)",
-        description="Maximum allowed difference in total polygon surface area between objects, as a percent of the bin average",
+        description="Maximum allowed difference in total polygon surface area between objects, as a percent of the bin representative",
         default=1.0,
         min=0.0,
         max=100.0)
     bpy.types.Scene.cad_bin_tol_volume = bpy.props.FloatProperty(
         name="Bounding Box Volume Tolerance (%)",
-        description="Maximum allowed difference in bounding-box volume between objects, as a percent of the bin average",
+        description="Maximum allowed difference in bounding-box volume between objects, as a percent of the bin representative",
         default=5.0,
         min=0.0,
         max=100.0)
+    bpy.types.Scene.cad_detect_verify = bpy.props.BoolProperty(
+        name="Verify Geometry",
+        description="Compare the vertices of every bin member with the bin representative and split bins on mismatch",
+        default=True)
+    bpy.types.Scene.cad_bin_tol_verify = bpy.props.FloatProperty(
+        name="Geometry Tolerance (%)",
+        description="Maximum vertex distance between bin members, as a percent of the bounding-box diagonal of the bin representative",
+        default=0.1,
+        min=0.0,
+        max=100.0)
     bpy.types.Scene.show_instance_tolerances = bpy.props.BoolProperty(
         name="Show Instance Detection Tolerances", default=True)
 
+    for handlers, handler in _CACHE_HANDLERS:
+        handlers.append(handler)
+
 def unregister():
+    for handlers, handler in _CACHE_HANDLERS:
+        if handler in handlers:
+            handlers.remove(handler)
+    cache_clear()
+    close_disk_cache()
+    _clear_similarity_index()
+    _bin_store.clear()
+    shutdown_process_pool()
+
     # unregister classes
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
@@ -264,22 +613,221 @@ def unregister():
 
     del bpy.types.Scene.linkable_collections
     del bpy.types.Scene.lin_col_idx
+    del bpy.types.Scene.lin_col_page
+    del bpy.types.Scene.cad_detect_mode
+    del bpy.types.Scene.cad_link_method
+    del bpy.types.Scene.cad_detect_scope
+    del bpy.types.Scene.cad_fingerprint_precision
+    del bpy.types.Scene.cad_pose_tolerance
+    del bpy.types.Scene.cad_pose_mirror
+    del bpy.types.Scene.cad_detect_use_processes
+    del bpy.types.Scene.cad_detect_processes
+    del bpy.types.Scene.cad_disk_cache
+    del bpy.types.Scene.cad_disk_cache_mb
     del bpy.types.Scene.cad_bin_tol_vertex
     del bpy.types.Scene.cad_bin_tol_axes
     del bpy.types.Scene.cad_bin_tol_surface
     del bpy.types.Scene.cad_bin_tol_volume
+    del bpy.types.Scene.cad_detect_verify
+    del bpy.types.Scene.cad_bin_tol_verify
     del bpy.types.Scene.show_instance_tolerances
 
 
+##############################################################################
+# Session Metric Cache
+##############################################################################
+# Per-mesh detection results (metric rows, fingerprints, descriptors) are kept
+# between rescans. Entries are keyed by the mesh session UID and validated
+# with a change stamp: element counts plus an edit counter that is bumped by
+# a depsgraph handler whenever the mesh geometry is updated.
+
+_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_metric_cache = collections.OrderedDict()
+_metric_cache_bytes = 0
+# session UID -> edit counter; never reset, so change stamps do not repeat
+_mesh_edits = {}
+# temporary evaluated mesh pointer -> ID it was made from (see scan_meshes)
+_mesh_owners = {}
+
+def _mesh_owner(mesh):
+    return _mesh_owners.get(mesh.as_pointer(), mesh)
+
+def _mesh_stamp(mesh):
+    return (
+        len(mesh.vertices),
+        len(mesh.edges),
+        len(mesh.polygons),
+        len(mesh.loops),
+        _mesh_edits.get(_mesh_owner(mesh).session_uid, 0),
+        )
+
+def _object_stamp(ob):
+    '''Change stamp of the geometry of an object, without evaluating it.'''
+    data = ob.data
+    if ob.type == 'MESH':
+        return (ob.session_uid, data.session_uid) + _mesh_stamp(data)
+    return (
+        ob.session_uid,
+        _mesh_edits.get(ob.session_uid, 0),
+        _mesh_edits.get(data.session_uid, 0) if data is not None else 0,
+        )
+
+def _value_size(value):
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+def cache_get(kind, mesh):
+    '''Return the cached value of kind for mesh, or None if missing or outdated.'''
+    key = (kind, _mesh_owner(mesh).session_uid)
+    entry = _metric_cache.get(key)
+    if entry is None or entry[0] != _mesh_stamp(mesh):
+        return None
+    _metric_cache.move_to_end(key)
+    return entry[1]
+
+def cache_put(kind, mesh, value):
+    '''Store value of kind for mesh, evicting least recently used entries.'''
+    global _metric_cache_bytes
+    key = (kind, _mesh_owner(mesh).session_uid)
+    old = _metric_cache.pop(key, None)
+    if old is not None:
+        _metric_cache_bytes -= old[2]
+    size = _value_size(value)
+    _metric_cache[key] = (_mesh_stamp(mesh), value, size)
+    _metric_cache_bytes += size
+    while _metric_cache_bytes > _CACHE_MAX_BYTES and _metric_cache:
+        _, evicted = _metric_cache.popitem(last=False)
+        _metric_cache_bytes -= evicted[2]
+
+def cache_clear():
+    global _metric_cache_bytes
+    _metric_cache.clear()
+    _metric_cache_bytes = 0
+
+@bpy.app.handlers.persistent
+def _on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        id_data = update.id.original
+        ids = [id_data]
+        if isinstance(id_data, bpy.types.Object) and id_data.data is not None:
+            # objects stand for their evaluated geometry (see scan_meshes)
+            ids.append(id_data.data)
+        for id_data in ids:
+            uid = id_data.session_uid
+            _mesh_edits[uid] = _mesh_edits.get(uid, 0) + 1
+
+@bpy.app.handlers.persistent
+def _on_cache_invalidate(*args):
+    # file loads and undo steps may swap geometry without depsgraph updates;
+    # the similarity index is kept, its stamps include the element counts
+    cache_clear()
+
+##############################################################################
+# Disk Cache
+##############################################################################
+# Descriptors are also kept in a memory-mapped file next to the .blend (see
+# descriptor_cache), keyed by the mesh name and a full geometry checksum, so
+# reopening a file only recomputes the meshes that changed.
+
+_disk_cache = None
+
+def get_disk_cache(scene):
+    '''Return the disk cache of the current file, or None if it is disabled,
+    the file is not saved or NumPy is missing.'''
+    global _disk_cache
+    if not scene.cad_disk_cache or not bpy.data.filepath or descriptor_cache.np is None:
+        return None
+    path = os.path.splitext(bpy.data.filepath)[0] + '.cad_cache'
+    max_bytes = scene.cad_disk_cache_mb * 1024 * 1024
+    if _disk_cache is not None and (_disk_cache.path != path or _disk_cache.max_bytes != max_bytes):
+        close_disk_cache()
+    if _disk_cache is None:
+        try:
+            _disk_cache = descriptor_cache.DescriptorCache(path, max_bytes)
+        except OSError as exc:
+            print(f'CAD Helper: disk cache unavailable ({exc})')
+            return None
+    return _disk_cache
+
+def flush_disk_cache():
+    if _disk_cache is not None:
+        try:
+            _disk_cache.flush()
+        except OSError as exc:
+            print(f'CAD Helper: could not write the disk cache ({exc})')
+
+def close_disk_cache():
+    global _disk_cache
+    if _disk_cache is not None:
+        try:
+            _disk_cache.close()
+        except OSError as exc:
+            print(f'CAD Helper: could not write the disk cache ({exc})')
+    _disk_cache = None
+
+def disk_key(kind, mesh):
+    '''Disk cache key of a mesh: its name (or the name of the ID an evaluated
+    mesh was made from) and the descriptor kind.'''
+    owner = _mesh_owner(mesh)
+    return hashlib.blake2b(f'{owner.bl_rna.identifier}:{owner.name_full}:{kind}'.encode(), digest_size=16).digest()
+
+def mesh_checksum(mesh):
+    '''Geometry checksum: a hash of the element counts, all vertex
+    positions, polygon sizes and corner vertex indices. Any edit of the
+    geometry changes it, so a stale descriptor is never read back.'''
+    counts = (len(mesh.vertices), len(mesh.edges), len(mesh.polygons), len(mesh.loops))
+    digest = hashlib.blake2b(array.array('q', counts).tobytes(), digest_size=16)
+    for buffer in shared_functions.get_mesh_buffers(mesh):
+        digest.update(memoryview(buffer).cast('B'))
+    return digest.digest()
+
+@bpy.app.handlers.persistent
+def _on_disk_cache_close(*args):
+    close_disk_cache()
+
+
 ##############################################################################
 # Helper Functions
 ##############################################################################
+def _is_valid(ob):
+    # objects may be deleted while a modal scan is running
+    try:
+        return ob.name is not None
+    except ReferenceError:
+        return False
+
+def compute_scan_batch(objects, scene):
+    '''Compute (and cache) the descriptors the scene's detection mode needs
+    for objects, without binning them.'''
+    mode = scene.cad_detect_mode
+    with scan_meshes(objects) as (meshes, mesh_objects):
+        if mode == 'METRICS':
+            get_meshes_metrics(meshes, mesh_objects, scene)
+        else:
+            get_mesh_descriptors('fingerprint' if mode == 'FINGERPRINT' else 'pose', meshes, scene)
+
+def bin_objects(objects, scene):
+    '''Bin objects with the scene's detection mode and fill the linkable collections.'''
+    if scene.cad_detect_mode == 'FINGERPRINT':
+        fingerprint_and_bin_objects(objects, scene)
+    elif scene.cad_detect_mode == 'POSE':
+        pose_and_bin_objects(objects, scene)
+    else:
+        summarize_and_bin_objects(objects, scene)
+
 # Metric calculation function for binning
 
-def get_object_metrics(ob):
-    if ob.type != 'MESH':
-        return None
-    mesh = ob.data
+def get_object_metrics(ob, mesh=None):
+    # Pure-Python metrics of a single object (fallback if NumPy is missing)
+    # mesh: evaluated mesh of non-mesh objects (see scan_meshes)
+    if mesh is None:
+        if ob.type != 'MESH':
+            return None
+        mesh = ob.data
     v_count = len(mesh.vertices)
     bbox = ob.bound_box
     xs = [v[0] for v in bbox]
@@ -305,64 +853,1164 @@ def get_object_metrics(ob):
         'surface': surface
     }
 
+def get_meshes_metrics(meshes, mesh_objects, scene, progress=None):
+    '''Return a metric row (METRIC_KEYS order) for every mesh of scan_meshes.
+
+    With NumPy, vertex coordinates and polygon areas of all unique meshes
+    are read with foreach_get into preallocated buffers and the metrics are
+    computed for the whole selection at once (see get_mesh_descriptors).
+    Objects sharing a mesh share its metrics; the bounding box is taken from
+    the mesh vertices.
+    '''
+    if instance_detection.np is not None:
+        return get_mesh_descriptors('metrics', meshes, scene, progress)
+    rows = []
+    for idx, mesh in enumerate(meshes):
+        if progress is not None:
+            progress(idx)
+        row = cache_get('metrics', mesh)
+        if row is None:
+            row = instance_detection.metrics_to_row(get_object_metrics(mesh_objects[mesh.as_pointer()][0], mesh))
+            cache_put('metrics', mesh, row)
+        rows.append(row)
+    return rows
+
+def unique_meshes(objects):
+    '''Return the unique meshes of the mesh objects, in order of appearance,
+    and a dict of mesh pointer -> objects using that mesh.'''
+    mesh_objects = {}
+    meshes = []
+    for ob in objects:
+        if ob.type != 'MESH':
+            continue
+        key = ob.data.as_pointer()
+        if key not in mesh_objects:
+            mesh_objects[key] = []
+            meshes.append(ob.data)
+        mesh_objects[key].append(ob)
+    return meshes, mesh_objects
+
+# Object types whose geometry is compared through their evaluated mesh
+_EVALUATED_TYPES = {'CURVE', 'SURFACE', 'FONT', 'META'}
+
+@contextlib.contextmanager
+def scan_meshes(objects):
+    '''Like unique_meshes, but curve, surface, text and metaball objects are
+    included with a temporary mesh of their evaluated geometry, one per
+    data-block (per object if it has modifiers). The temporary meshes are
+    cached under the ID they were made from and freed on exit.'''
+    meshes, mesh_objects = unique_meshes(objects)
+    evaluated = {}
+    depsgraph = None
+    for ob in objects:
+        if ob.type not in _EVALUATED_TYPES:
+            continue
+        owner = ob if ob.modifiers else ob.data
+        key = owner.as_pointer()
+        if key not in evaluated:
+            if depsgraph is None:
+                depsgraph = bpy.context.evaluated_depsgraph_get()
+            ob_eval = ob.evaluated_get(depsgraph)
+            evaluated[key] = (ob_eval, owner, ob_eval.to_mesh(), [])
+        evaluated[key][3].append(ob)
+    try:
+        for ob_eval, owner, mesh, obs in evaluated.values():
+            # e.g. metaballs other than the base of their family are empty
+            if mesh is None or len(mesh.vertices) == 0:
+                continue
+            _mesh_owners[mesh.as_pointer()] = owner
+            meshes.append(mesh)
+            mesh_objects[mesh.as_pointer()] = obs
+        yield meshes, mesh_objects
+    finally:
+        for ob_eval, owner, mesh, obs in evaluated.values():
+            if mesh is not None:
+                _mesh_owners.pop(mesh.as_pointer(), None)
+            ob_eval.to_mesh_clear()
+
+def object_meshes(mesh_objects, meshes):
+    '''Return a dict of object -> its (possibly evaluated) mesh.'''
+    return {ob: mesh for mesh in meshes for ob in mesh_objects[mesh.as_pointer()]}
+
+def split_by_type(bins, type_of=lambda ob: ob.type):
+    '''Split bins so that each bin only holds members of one object type
+    (only data of the same type can be linked).'''
+    split = []
+    for b in bins:
+        by_type = {}
+        for member in b:
+            by_type.setdefault(type_of(member), []).append(member)
+        split.extend(by_type.values())
+    return split
+
 def summarize_and_bin_objects(objects, scene):
-    import statistics
     wm = bpy.context.window_manager
-    total = len(objects)
-    wm.progress_begin(0, total)
-    metrics = []
-    for idx, ob in enumerate(objects):
-        wm.progress_update(idx)
-        m = get_object_metrics(ob)
-        if m:
-            metrics.append(m)
-    wm.progress_end()
-    # Binning
+    with scan_meshes(objects) as (meshes, mesh_objects):
+        wm.progress_begin(0, len(meshes))
+        mesh_rows = get_meshes_metrics(meshes, mesh_objects, scene, progress=wm.progress_update)
+        wm.progress_end()
+        # one row per object, objects without geometry are left out
+        meshes_of = object_meshes(mesh_objects, meshes)
+        rows_of = {mesh.as_pointer(): row for mesh, row in zip(meshes, mesh_rows)}
+        binned_objects = [ob for ob in objects if ob in meshes_of]
+        rows = [rows_of[meshes_of[ob].as_pointer()] for ob in binned_objects]
+        index_bins = bin_metric_rows(rows, [ob.name for ob in binned_objects], scene)
+        bins = [[binned_objects[i] for i in b] for b in index_bins]
+        if scene.cad_detect_verify:
+            bins = verify_bins(bins, scene.cad_bin_tol_verify / 100.0, meshes_of)
+    populate_linkable_collections(scene, bins)
+
+def bin_metric_rows(rows, names, scene):
+    '''Bin metric rows (list or NumPy array) with the scene tolerances.
+    Returns bins of row indices; names break ties between equal rows.'''
     tol_vertex = scene.cad_bin_tol_vertex / 100.0
     tol_axes = scene.cad_bin_tol_axes / 100.0
     tol_surface = scene.cad_bin_tol_surface / 100.0
     tol_volume = scene.cad_bin_tol_volume / 100.0
+    tolerances = {
+        'vertex_count': tol_vertex,
+        'x_min': tol_axes,
+        'x_max': tol_axes,
+        'y_min': tol_axes,
+        'y_max': tol_axes,
+        'z_min': tol_axes,
+        'z_max': tol_axes,
+        'volume': tol_volume,
+        'surface': tol_surface,
+    }
+    index_bins = instance_detection.bin_metrics(
+        rows,
+        [tolerances[k] for k in instance_detection.METRIC_KEYS],
+        tie_breakers=names,
+        )
+    return index_bins
+
+# Vertices compared per object when the vertex order of two meshes differs
+def verify_bins(bins, tolerance, meshes_of):
+    '''Split bins whose members differ from the representative at vertex level.
+
+    meshes_of: dict of object -> its (possibly evaluated) mesh.
+
+    tolerance: maximum vertex distance, relative to the bounding-box diagonal
+    of the representative. Meshes with the same vertex count are compared
+    vertex by vertex first; if that fails (e.g. different vertex order),
+    the symmetric Hausdorff distance over all vertices is checked
+    (see instance_detection.within_distance; KD-trees without NumPy).
+    '''
+    coordinates = {}
+    trees = {}
+
+    def points(mesh):
+        key = mesh.as_pointer()
+        if key not in coordinates:
+            coordinates[key] = shared_functions.get_mesh_coordinates(mesh)
+        return coordinates[key]
+
+    def tree(mesh):
+        key = mesh.as_pointer()
+        if key not in trees:
+            pts = points(mesh)
+            kd = mathutils.kdtree.KDTree(len(pts))
+            for i, co in enumerate(pts):
+                kd.insert(co, i)
+            kd.balance()
+            trees[key] = kd
+        return trees[key]
+
+    def within_distance(src, dst, limit):
+        if instance_detection.np is not None:
+            return instance_detection.within_distance(points(src), points(dst), limit)
+        kd = tree(dst)
+        for co in points(src):
+            found = kd.find(co)
+            if found[0] is None or found[2] > limit:
+                return False
+        return True
+
+    def same_geometry(rep, ob):
+        rep_mesh = meshes_of[rep]
+        ob_mesh = meshes_of[ob]
+        if rep_mesh == ob_mesh:
+            return True
+        a = points(rep_mesh)
+        b = points(ob_mesh)
+        if len(a) == 0 or len(b) == 0:
+            return len(a) == len(b)
+        limit = tolerance * max(instance_detection.bbox_diagonal(a), 1e-8)
+        if len(a) == len(b) and instance_detection.max_point_distance(a, b) <= limit:
+            return True
+        return within_distance(ob_mesh, rep_mesh, limit) and within_distance(rep_mesh, ob_mesh, limit)
+
+    verified = []
+    for b in bins:
+        if len(b) < 2:
+            verified.append(b)
+            continue
+        verified.extend(instance_detection.split_by_match(b, same_geometry))
+        # every mesh belongs to one bin, release its vertices
+        coordinates.clear()
+        trees.clear()
+    return verified
+
+# Buffers read from every mesh per descriptor kind:
+# (mesh collection, attribute, dtype, values per element)
+_DESCRIPTOR_BUFFERS = {
+    'metrics': (
+        ('vertices', 'co', 'f4', 3),
+        ('polygons', 'area', 'f4', 1),
+    ),
+    'pose': (
+        ('vertices', 'co', 'f4', 3),
+    ),
+    'shape': (
+        ('vertices', 'co', 'f4', 3),
+        ('polygons', 'area', 'f4', 1),
+    ),
+    'fingerprint': (
+        ('vertices', 'co', 'f4', 3),
+        ('polygons', 'loop_total', 'i4', 1),
+        ('loops', 'vertex_index', 'i4', 1),
+    ),
+}
+
+# Below this number of meshes, starting the worker processes is not worth it
+_PROCESS_MIN_MESHES = 500
+
+# The worker processes are shut down after this many seconds without tasks
+_PROCESS_POOL_IDLE = 60.0
+
+_process_pool = None
+_process_pool_size = 0
+_process_pool_used = 0.0
+
+def get_mesh_descriptors(kind, meshes, scene, progress=None):
+    '''Return the descriptors of kind ('metrics', 'pose' or 'fingerprint')
+    for every mesh.
+
+    Cached values (session cache, then disk cache) are reused. The missing ones are computed in worker
+    processes for large scans (if enabled in the scene), otherwise on the
+    main thread.
+    '''
+    precision = scene.cad_fingerprint_precision
+    cache_kind = (kind, precision) if kind == 'fingerprint' else kind
+    values = [cache_get(cache_kind, mesh) for mesh in meshes]
+    missing = [i for i, value in enumerate(values) if value is None]
+    if not missing:
+        return values
+
+    disk = get_disk_cache(scene)
+    disk_keys = {}
+    if disk is not None:
+        not_on_disk = []
+        for i in missing:
+            key = disk_key(cache_kind, meshes[i])
+            checksum = mesh_checksum(meshes[i])
+            value = disk.get(key, checksum)
+            if value is None:
+                disk_keys[i] = (key, checksum)
+                not_on_disk.append(i)
+            else:
+                values[i] = value
+                cache_put(cache_kind, meshes[i], value)
+        missing = not_on_disk
+        if not missing:
+            return values
+    missing_meshes = [meshes[i] for i in missing]
+
+    computed = None
+    if (
+        scene.cad_detect_use_processes
+        and instance_detection.np is not None
+        and len(missing) >= _PROCESS_MIN_MESHES
+    ):
+        try:
+            computed = _compute_in_processes(kind, missing_meshes, precision, scene.cad_detect_processes, progress)
+        except Exception as exc:
+            print(f'CAD Helper: worker processes failed, computing on the main thread ({exc})')
+    if computed is None:
+        computed = _compute_in_process(kind, missing_meshes, precision, progress)
+
+    for i, value in zip(missing, computed):
+        values[i] = value
+        cache_put(cache_kind, meshes[i], value)
+        if disk is not None:
+            disk.put(*disk_keys[i], value)
+    return values
+
+def _buffer_counts(kind, meshes):
+    np = instance_detection.np
+    return [
+        np.fromiter((len(getattr(m, collection)) for m in meshes), dtype=np.int64, count=len(meshes))
+        for collection, _, _, _ in _DESCRIPTOR_BUFFERS[kind]
+        ]
+
+def _read_buffers(kind, meshes, counts, buffers, progress=None):
+    # read the buffers of all meshes into the preallocated, concatenated arrays
+    specs = _DESCRIPTOR_BUFFERS[kind]
+    starts = [0] * len(specs)
+    for idx, mesh in enumerate(meshes):
+        if progress is not None:
+            progress(idx)
+        for b, (collection, attribute, _, items) in enumerate(specs):
+            end = starts[b] + int(counts[b][idx]) * items
+            getattr(mesh, collection).foreach_get(attribute, buffers[b][starts[b]:end])
+            starts[b] = end
+
+def _compute_in_process(kind, meshes, precision, progress=None):
+    if kind == 'fingerprint':
+        def buffers():
+            # buffers are read on the main thread while the pool hashes the previous ones
+            for idx, mesh in enumerate(meshes):
+                if progress is not None:
+                    progress(idx)
+                yield shared_functions.get_mesh_buffers(mesh)
+
+        return instance_detection.fingerprint_all(buffers(), precision)
+
+    np = instance_detection.np
+    counts = _buffer_counts(kind, meshes)
+    buffers = [
+        np.empty(int(c.sum()) * items, dtype=dtype)
+        for c, (_, _, dtype, items) in zip(counts, _DESCRIPTOR_BUFFERS[kind])
+        ]
+    _read_buffers(kind, meshes, counts, buffers, progress)
+    return instance_detection.compute_descriptors(kind, buffers, counts, precision)
+
+def _compute_in_processes(kind, meshes, precision, processes, progress=None):
+    '''Read the buffers of all meshes into one shared memory block and
+    compute the descriptors in chunks on the worker process pool.'''
+    np = instance_detection.np
+    pool = _get_process_pool(processes)
+    specs = _DESCRIPTOR_BUFFERS[kind]
+    counts = _buffer_counts(kind, meshes)
+
+    layout = []
+    size = 0
+    for c, (_, _, dtype, items) in zip(counts, specs):
+        layout.append((dtype, size, items))
+        size += int(c.sum()) * items * np.dtype(dtype).itemsize
+        size = (size + 7) // 8 * 8
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        buffers = [
+            np.ndarray(int(c.sum()) * items, dtype=dtype, buffer=block.buf, offset=offset)
+            for c, (dtype, offset, items) in zip(counts, layout)
+            ]
+        _read_buffers(kind, meshes, counts, buffers, progress)
+        del buffers
+
+        offsets = [np.concatenate(([0], np.cumsum(c))) for c in counts]
+        tasks = []
+        for lo, hi in instance_detection.balanced_chunks(counts[0], _process_pool_size * 4):
+            tasks.append(pool.apply_async(_WorkerFunction('descriptor_worker'), (
+                kind,
+                block.name,
+                layout,
+                [c[lo:hi].tolist() for c in counts],
+                [int(o[lo]) for o in offsets],
+                precision,
+                )))
+        results = []
+        for task in tasks:
+            results.extend(task.get())
+        return results
+    finally:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+        _touch_process_pool()
+
+# Workers are plain Python interpreters without bpy, so they can not import
+# this package. The pool initializer puts the directory of the bpy-free
+# instance_detection module on their sys.path (also for workers the pool
+# starts later), and tasks refer to its functions by name, so only the
+# workers import it as a top-level module.
+
+class _WorkerModule:
+    def __reduce__(self):
+        return importlib.import_module, ('instance_detection',)
+
+class _WorkerFunction:
+    '''Function of instance_detection, unpickled in a worker process as the
+    function of its top-level instance_detection module.'''
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args):
+        return getattr(instance_detection, self.name)(*args)
+
+    def __reduce__(self):
+        return getattr, (_WorkerModule(), self.name)
+
+def _get_process_pool(processes):
+    '''Return the (cached) worker process pool.'''
+    global _process_pool, _process_pool_size
+    processes = processes or os.cpu_count() or 1
+    if _process_pool is not None and _process_pool_size == processes:
+        return _process_pool
+    shutdown_process_pool()
+    module_dir = os.path.dirname(os.path.abspath(instance_detection.__file__))
+    _process_pool = multiprocessing.get_context('spawn').Pool(
+        processes,
+        initializer=site.addsitedir,
+        initargs=(module_dir,),
+        )
+    _process_pool_size = processes
+    return _process_pool
+
+def _touch_process_pool():
+    # restart the idle countdown of the worker processes
+    global _process_pool_used
+    _process_pool_used = time.monotonic()
+    if not bpy.app.timers.is_registered(_shutdown_idle_process_pool):
+        bpy.app.timers.register(_shutdown_idle_process_pool, first_interval=_PROCESS_POOL_IDLE, persistent=True)
+
+def _shutdown_idle_process_pool():
+    idle = time.monotonic() - _process_pool_used
+    if idle < _PROCESS_POOL_IDLE:
+        return _PROCESS_POOL_IDLE - idle
+    shutdown_process_pool()
+    return None
+
+def shutdown_process_pool():
+    global _process_pool, _process_pool_size
+    if bpy.app.timers.is_registered(_shutdown_idle_process_pool):
+        bpy.app.timers.unregister(_shutdown_idle_process_pool)
+    if _process_pool is not None:
+        _process_pool.terminate()
+        _process_pool.join()
+    _process_pool = None
+    _process_pool_size = 0
+
+def fingerprint_and_bin_objects(objects, scene):
+    '''Group objects whose (evaluated) mesh has an identical geometry fingerprint.'''
+    wm = bpy.context.window_manager
+    with scan_meshes(objects) as (meshes, mesh_objects):
+        wm.progress_begin(0, len(meshes))
+        fingerprints = get_mesh_descriptors('fingerprint', meshes, scene, wm.progress_update)
+        wm.progress_end()
+        fingerprints = {mesh.as_pointer(): f for mesh, f in zip(meshes, fingerprints)}
+
+    groups = {}
+    for key, obs in mesh_objects.items():
+        groups.setdefault(fingerprints[key], []).extend(obs)
+    bins = [sorted(group, key=lambda ob: ob.name) for group in groups.values()]
+    populate_linkable_collections(scene, bins)
+
+def pose_and_bin_objects(objects, scene):
+    '''Group objects with identical geometry in any pose.
+
+    Unique meshes are binned by pose-invariant descriptors, then every bin
+    is split into groups whose vertices are related by a rigid transform.
+    The transform is stored per object, so linking can keep the object in
+    place while it uses the representative's mesh.
+    '''
+    with scan_meshes(objects) as (meshes, mesh_objects):
+        bins, corrections = _pose_bins(meshes, mesh_objects, scene)
+    populate_linkable_collections(scene, bins, corrections)
+
+def _pose_bins(meshes, mesh_objects, scene, rows=None):
+    '''Return the bins of objects and their corrections. rows: pose
+    descriptors of the meshes, computed if None.'''
+    np = instance_detection.np
+
+    def read_coordinates(mesh):
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        return co
+
+    if rows is None:
+        wm = bpy.context.window_manager
+        wm.progress_begin(0, len(meshes))
+        rows = get_mesh_descriptors('pose', meshes, scene, wm.progress_update)
+        wm.progress_end()
+
+    tol_shape = scene.cad_bin_tol_axes / 100.0
+    tolerances = [0.0] + [tol_shape] * (len(instance_detection.POSE_KEYS) - 1)
+    # mirror images only share a bin if they may be linked mirrored
+    tolerances[instance_detection.POSE_CHIRALITY_COLUMN] = float('inf') if scene.cad_pose_mirror else 0.0
+    mesh_bins = instance_detection.bin_metrics(
+        rows,
+        tolerances,
+        tie_breakers=[mesh.name for mesh in meshes],
+        key_columns=instance_detection.POSE_KEY_COLUMNS,
+        )
+
     bins = []
-    for ob, metrics in zip(objects, metrics):
-        found_bin = None
-        for b in bins:
-            avg = b['avg']
-            if (
-                abs(metrics['vertex_count'] - avg['vertex_count']) <= tol_vertex * avg['vertex_count'] and
-                abs(metrics['x_min'] - avg['x_min']) <= tol_axes * max(abs(avg['x_min']), 1e-8) and
-                abs(metrics['x_max'] - avg['x_max']) <= tol_axes * max(abs(avg['x_max']), 1e-8) and
-                abs(metrics['y_min'] - avg['y_min']) <= tol_axes * max(abs(avg['y_min']), 1e-8) and
-                abs(metrics['y_max'] - avg['y_max']) <= tol_axes * max(abs(avg['y_max']), 1e-8) and
-                abs(metrics['z_min'] - avg['z_min']) <= tol_axes * max(abs(avg['z_min']), 1e-8) and
-                abs(metrics['z_max'] - avg['z_max']) <= tol_axes * max(abs(avg['z_max']), 1e-8) and
-                abs(metrics['surface'] - avg['surface']) <= tol_surface * max(abs(avg['surface']), 1e-8) and
-                abs(metrics['volume'] - avg['volume']) <= tol_volume * max(abs(avg['volume']), 1e-8)
-            ):
-                found_bin = b
-                break
-        if found_bin:
-            found_bin['objects'].append(ob)
-            n = len(found_bin['objects'])
-            for k in avg:
-                avg[k] = (avg[k] * (n-1) + metrics[k]) / n
-        else:
-            bins.append({'objects': [ob], 'avg': metrics.copy()})
-    bins = [b for b in bins if len(b['objects']) > 1]
+    corrections = {}
+    # only data of the same type can be linked
+    mesh_bins = split_by_type(mesh_bins, lambda i: mesh_objects[meshes[i].as_pointer()][0].type)
+    for mesh_bin in mesh_bins:
+        if len(mesh_bin) < 2:
+            continue
+        # vertices are only read for meshes with candidates, one bin at a time
+        groups = instance_detection.split_by_rigid_match(
+            [read_coordinates(meshes[i]) for i in mesh_bin],
+            scene.cad_pose_tolerance,
+            allow_reflection=scene.cad_pose_mirror,
+            )
+        for group in groups:
+            group_objects = []
+            for member, matrix in group:
+                members = sorted(mesh_objects[meshes[mesh_bin[member]].as_pointer()], key=lambda ob: ob.name)
+                group_objects.extend(members)
+                if member != group[0][0]:
+                    correction = mathutils.Matrix(matrix.tolist())
+                    for ob in members:
+                        corrections[ob] = correction
+            bins.append(group_objects)
+    return bins, corrections
+
+def object_index():
+    '''Map the session UID of every object to the object.'''
+    return {ob.session_uid: ob for ob in bpy.data.objects}
+
+def link_collection_items(bins):
+    '''Link the objects of every bin (see Bin Store) to the data of its
+    first object in one pass, then purge the data-blocks that became unused.
+
+    Objects with a pose correction keep their place: the correction is
+    applied to the object transform and compensated for its children.
+
+    Returns (number of relinked objects, number of freed data-blocks,
+    estimated number of freed bytes).
+    '''
+    objects_index = object_index()
+    replaced = {}
+    relinked = 0
+    for linkable_bin in bins:
+        members = bin_members(linkable_bin, objects_index)
+        if len(members) < 2:
+            continue
+        first_data = members[0][0].data
+        for obj, correction in members[1:]:
+            if obj.data == first_data:
+                continue
+            replaced[obj.data.as_pointer()] = obj.data
+            obj.data = first_data
+            relinked += 1
+            if correction is not None:
+                correction_inv = correction.inverted_safe()
+                obj.matrix_basis = obj.matrix_basis @ correction
+                for child in obj.children:
+                    child.matrix_parent_inverse = correction_inv @ child.matrix_parent_inverse
+
+    unused = [data for data in replaced.values() if data.users == 0]
+    freed_bytes = sum(estimate_data_bytes(data) for data in unused)
+    if unused:
+        bpy.data.batch_remove(unused)
+    return relinked, len(unused), freed_bytes
+
+# Bytes per value of the attribute data types
+_ATTRIBUTE_BYTES = {
+    'FLOAT': 4,
+    'INT': 4,
+    'FLOAT_VECTOR': 12,
+    'FLOAT_COLOR': 16,
+    'BYTE_COLOR': 4,
+    'BOOLEAN': 1,
+    'FLOAT2': 8,
+    'INT8': 1,
+    'INT16_2D': 4,
+    'INT32_2D': 8,
+    'QUATERNION': 16,
+    'FLOAT4X4': 64,
+}
+
+def estimate_data_bytes(data):
+    '''Rough estimate of the memory used by the geometry of a mesh.'''
+    if not isinstance(data, bpy.types.Mesh):
+        return 0
+    domain_sizes = {
+        'POINT': len(data.vertices),
+        'EDGE': len(data.edges),
+        'FACE': len(data.polygons),
+        'CORNER': len(data.loops),
+    }
+    # positions, edge vertices, corner vertices and edges, face offsets
+    total = domain_sizes['POINT'] * 12 + domain_sizes['EDGE'] * 8 + domain_sizes['CORNER'] * 8 + domain_sizes['FACE'] * 4
+    for attribute in data.attributes:
+        if attribute.name == 'position':
+            continue
+        total += domain_sizes.get(attribute.domain, 0) * _ATTRIBUTE_BYTES.get(attribute.data_type, 4)
+    return total
+
+def report_link_result(op, n_collections, result):
+    relinked, freed, freed_bytes = result
+    shared_functions.report_info(
+        op,
+        f'Linked {n_collections} collections: relinked {relinked} objects, '
+        f'freed {freed} data-blocks (~{freed_bytes / 1024 ** 2:.1f} MB)',
+        )
+
+def populate_linkable_collections(scene, bins, corrections=None):
+    '''Store bins (lists of objects) in the bin store and show the first
+    page in the linkable collections list.
+    The first object of a bin is its representative.
+    corrections: optional dict of object -> 4x4 matrix mapping the
+    representative's mesh onto the object's mesh.'''
+    corrections = corrections or {}
+    bins = [b for b in split_by_type(bins) if len(b) > 1]
     # Discard bins where all objects already share the same mesh data (already linked)
-    def all_linked(bin_objs):
-        if len(bin_objs) < 2:
-            return False
-        mesh_datas = set(obj.data for obj in bin_objs)
-        return len(mesh_datas) == 1
-
-    bins = [b for b in bins if not all_linked(b['objects'])]
-    bins.sort(key=lambda b: len(b['objects']), reverse=True)
-    # Populate linkable_collections with bins
+    bins = [b for b in bins if len(set(obj.data for obj in b)) > 1]
+    # sort by size, then by name of the representative (independent of selection order)
+    bins.sort(key=lambda b: (-len(b), b[0].name))
+    _bin_store[scene.session_uid] = [
+        LinkableBin(
+            array.array('q', (obj.session_uid for obj in b)),
+            {i: corrections[obj].copy() for i, obj in enumerate(b) if obj in corrections},
+            )
+        for b in bins
+        ]
+    show_page(scene, 0)
+
+
+##############################################################################
+# Streaming Scan
+##############################################################################
+# Scanning every mesh of a file keeps nothing per mesh but its compact
+# descriptor (float32 row or 16 byte fingerprint) in one preallocated array.
+# Meshes are read in chunks of a bounded number of vertices and the buffers
+# of a chunk are released before the next one is read, so the peak memory
+# does not grow with the size of the file.
+
+_STREAM_CHUNK_VERTICES = 2_000_000
+
+_MODE_KINDS = {'METRICS': 'metrics', 'FINGERPRINT': 'fingerprint', 'POSE': 'pose'}
+
+class DescriptorStream:
+    '''Descriptors of all meshes used by objects of the file, computed chunk
+    by chunk (see step) and binned at the end (see populate).'''
+
+    def __init__(self, scene):
+        np = instance_detection.np
+        self.kind = _MODE_KINDS[scene.cad_detect_mode]
+        self.meshes, self.mesh_objects = unique_meshes(bpy.data.objects)
+        n = len(self.meshes)
+        if self.kind == 'fingerprint':
+            self.values = np.zeros((n, 16), dtype=np.uint8)
+        else:
+            keys = instance_detection.POSE_KEYS if self.kind == 'pose' else instance_detection.METRIC_KEYS
+            self.values = np.zeros((n, len(keys)), dtype=np.float32)
+        self.valid = np.zeros(n, dtype=bool)
+        self.index = 0
+
+    def __len__(self):
+        return len(self.meshes)
+
+    def step(self, scene, max_meshes):
+        '''Compute the descriptors of the next chunk: at most max_meshes
+        meshes with about _STREAM_CHUNK_VERTICES vertices in total.'''
+        np = instance_detection.np
+        chunk = []
+        positions = []
+        n_vertices = 0
+        end = self.index
+        while end < len(self.meshes) and end - self.index < max_meshes and n_vertices < _STREAM_CHUNK_VERTICES:
+            mesh = self.meshes[end]
+            if _is_valid(mesh):
+                chunk.append(mesh)
+                positions.append(end)
+                n_vertices += len(mesh.vertices)
+            end += 1
+        self.index = end
+        if not chunk:
+            return
+        values = get_mesh_descriptors(self.kind, chunk, scene)
+        if self.kind == 'fingerprint':
+            values = np.frombuffer(b''.join(values), dtype=np.uint8).reshape(-1, 16)
+        self.values[positions] = values
+        self.valid[positions] = True
+
+    def populate(self, scene):
+        '''Bin the meshes scanned so far and fill the linkable collections.'''
+        np = instance_detection.np
+        done = [int(i) for i in np.flatnonzero(self.valid[:self.index]) if _is_valid(self.meshes[i])]
+        meshes = [self.meshes[i] for i in done]
+        values = self.values[done]
+        self.values = None
+
+        def objects_of(mesh):
+            return sorted(self.mesh_objects[mesh.as_pointer()], key=lambda ob: ob.name)
+
+        corrections = None
+        if self.kind == 'fingerprint':
+            groups = {}
+            for i, row in enumerate(values):
+                groups.setdefault(row.tobytes(), []).append(i)
+            mesh_bins = list(groups.values())
+        elif self.kind == 'pose':
+            mesh_objects = {mesh.as_pointer(): objects_of(mesh) for mesh in meshes}
+            bins, corrections = _pose_bins(meshes, mesh_objects, scene, values)
+        else:
+            mesh_bins = bin_metric_rows(values, [mesh.name for mesh in meshes], scene)
+        if self.kind != 'pose':
+            mesh_bins = [b for b in mesh_bins if len(b) > 1]
+            bins = [[ob for i in b for ob in objects_of(meshes[i])] for b in mesh_bins]
+        if self.kind == 'metrics' and scene.cad_detect_verify:
+            meshes_of = {ob: meshes[i] for b in mesh_bins for i in b for ob in self.mesh_objects[meshes[i].as_pointer()]}
+            bins = verify_bins(bins, scene.cad_bin_tol_verify / 100.0, meshes_of)
+        populate_linkable_collections(scene, bins, corrections)
+
+##############################################################################
+# Bin Store
+##############################################################################
+# Detected bins are kept here, outside of the Scene: per bin an array of the
+# member session UIDs and the sparse pose corrections. The Scene list only
+# holds one page of thin items pointing into the store, so filling it is
+# O(bins on the page) and nothing of it bloats the .blend or the undo steps.
+# The store is rebuilt by every scan and dropped when a file is loaded.
+
+LinkableBin = collections.namedtuple('LinkableBin', ('uids', 'corrections'))
+
+_BIN_PAGE_SIZE = 500
+
+# scene session UID -> list of LinkableBin
+_bin_store = {}
+
+def get_bins(scene):
+    return _bin_store.get(scene.session_uid, [])
+
+def get_bin(scene, item):
+    '''Return the bin of a linkable collections list item, or None.'''
+    bins = get_bins(scene)
+    if 0 <= item.bin_index < len(bins):
+        return bins[item.bin_index]
+    return None
+
+def bin_members(linkable_bin, objects_index):
+    '''Return the (object, correction matrix or None) pairs of the bin
+    members that still exist.
+
+    A correction maps the mesh of the first returned member onto the mesh
+    of the member. If the representative was deleted after the scan, the
+    stored corrections (relative to the representative) are re-based onto
+    the first remaining member.'''
+    if linkable_bin is None:
+        return []
+    members = []
+    for i, uid in enumerate(linkable_bin.uids):
+        obj = objects_index.get(uid)
+        if obj is not None:
+            members.append((obj, linkable_bin.corrections.get(i)))
+    first_correction = members[0][1] if members else None
+    if first_correction is not None:
+        # member = C_i @ representative = C_i @ inverse(C_first) @ first
+        first_inverse = first_correction.inverted_safe()
+        members = [
+            (obj, None if correction == first_correction
+             else first_inverse if correction is None
+             else correction @ first_inverse)
+            for obj, correction in members
+            ]
+    return members
+
+def page_count(scene):
+    return -(-len(get_bins(scene)) // _BIN_PAGE_SIZE)
+
+def bin_is_linkable(linkable_bin, objects_index):
+    '''A bin can be linked while at least two of its members exist and
+    they do not all share one data-block yet.'''
+    members = bin_members(linkable_bin, objects_index)
+    return len(set(obj.data for obj, _ in members)) >= 2
+
+def prune_bins(scene, candidates=None):
+    '''Drop the bins that can no longer be linked (linked already, or
+    members deleted) from the store. Only the candidates are checked (all
+    bins if None), so the link operators only pay for the bins they linked.
+    Returns the remaining bins.'''
+    objects_index = object_index()
+    bins = get_bins(scene)
+    if candidates is None:
+        dropped = {id(b) for b in bins if not bin_is_linkable(b, objects_index)}
+    else:
+        dropped = {id(b) for b in candidates if not bin_is_linkable(b, objects_index)}
+    if dropped and scene.session_uid in _bin_store:
+        bins = [b for b in bins if id(b) not in dropped]
+        _bin_store[scene.session_uid] = bins
+    return bins
+
+def refresh_linkable_collections(scene):
+    '''Fill the linkable collections list with the current page of bins,
+    in O(bins on the page).'''
+    bins = get_bins(scene)
+    start = min(scene.lin_col_page, max(page_count(scene) - 1, 0)) * _BIN_PAGE_SIZE
     scene.linkable_collections.clear()
-    for i, b in enumerate(bins):
+    for i in range(start, min(start + _BIN_PAGE_SIZE, len(bins))):
         item = scene.linkable_collections.add()
         item.name = f"Bin {i+1}"
-        for obj in b['objects']:
-            ob_item = item.objects.add()
-            ob_item.name = obj.name
-        item.N_objects = len(b['objects'])
+        item.bin_index = i
+        item.N_objects = len(bins[i].uids)
+    n_items = len(scene.linkable_collections)
+    if n_items and not 0 <= scene.lin_col_idx < n_items:
+        # the update callback would replace the selection with the bin members
+        global _suppress_index_callback
+        _suppress_index_callback = True
+        try:
+            scene.lin_col_idx = n_items - 1
+        finally:
+            _suppress_index_callback = False
+
+def show_page(scene, page):
+    if scene.lin_col_page != page:
+        scene.lin_col_page = page  # the update callback refreshes the list
+    else:
+        refresh_linkable_collections(scene)
+
+@bpy.app.handlers.persistent
+def _on_load_clear_bins(*args):
+    _bin_store.clear()
+    # the list items of the loaded file point into a store that is gone
+    for scene in bpy.data.scenes:
+        scene.linkable_collections.clear()
+
+# registered in register(); defined after all of the handlers it refers to
+_CACHE_HANDLERS = (
+    (bpy.app.handlers.load_pre, _on_disk_cache_close),
+    (bpy.app.handlers.load_post, _on_load_clear_bins),
+    (bpy.app.handlers.depsgraph_update_post, _on_depsgraph_update),
+    (bpy.app.handlers.load_post, _on_cache_invalidate),
+    (bpy.app.handlers.undo_post, _on_cache_invalidate),
+    (bpy.app.handlers.redo_post, _on_cache_invalidate),
+)
+
+
+##############################################################################
+# Instancing
+##############################################################################
+# Instead of sharing the mesh data between thousands of objects, a linkable
+# collection can be replaced by one source object and instances of it: either
+# collection instance empties (one per member) or a single point cloud object
+# whose Geometry Nodes modifier instances the source on every point.
+
+_SOURCES_COLLECTION = 'CAD Instance Sources'
+_NODE_GROUP_NAME = 'CAD Instance on Points'
+_MIRROR_X = mathutils.Matrix.Diagonal((-1.0, 1.0, 1.0, 1.0))
+
+def can_instance(obj):
+    '''True if the object can be replaced by an instance without losing
+    anything: a plain mesh object without children, modifiers or
+    object-linked materials.'''
+    return (
+        obj.type == 'MESH'
+        and not obj.children
+        and not obj.modifiers
+        and not any(slot.link == 'OBJECT' for slot in obj.material_slots)
+        )
+
+def instance_collection_items(bins, method, context):
+    '''Replace the objects of every bin (see Bin Store) by instances of
+    one source object. method is 'COLLECTION' or 'POINTS'.
+
+    The members are linked first (see link_collection_items), so every
+    member shows the source geometry with its world matrix. Members that
+    cannot be instanced (see can_instance) stay linked objects.
+
+    Returns (number of replaced objects, number of created objects,
+    number of freed data-blocks, estimated number of freed bytes).
+    '''
+    _, freed, freed_bytes = link_collection_items(bins)
+    # the link step may have changed object transforms
+    context.view_layer.update()
+
+    objects_index = object_index()
+    removed = []
+    renames = []
+    created = 0
+    for linkable_bin in bins:
+        members = [obj for obj, _ in bin_members(linkable_bin, objects_index) if can_instance(obj)]
+        if len(members) < 2:
+            continue
+        source_collection = _new_source_collection(context, members[0])
+        source = bpy.data.objects.new(members[0].data.name, members[0].data)
+        source_collection.objects.link(source)
+        if method == 'COLLECTION':
+            for obj in members:
+                renames.append((_new_collection_instance(obj, source_collection), obj.name))
+            created += len(members)
+        else:
+            _new_point_instances(members, source)
+            created += 1
+        removed.extend(members)
+
+    if removed:
+        bpy.data.batch_remove(removed)
+    # the instances take over the names of the removed objects
+    for instance, name in renames:
+        instance.name = name
+    return len(removed), created, freed, freed_bytes
+
+def _new_source_collection(context, obj):
+    '''Create the collection holding one source object. Source collections
+    are kept in a scene collection that is excluded from the view layer.'''
+    root = bpy.data.collections.get(_SOURCES_COLLECTION)
+    if root is None:
+        root = bpy.data.collections.new(_SOURCES_COLLECTION)
+    if root.name not in context.scene.collection.children:
+        context.scene.collection.children.link(root)
+    layer_collection = context.view_layer.layer_collection.children.get(root.name)
+    if layer_collection is not None:
+        layer_collection.exclude = True
+    collection = bpy.data.collections.new(obj.name)
+    root.children.link(collection)
+    return collection
+
+def _new_collection_instance(obj, collection):
+    '''Create an empty instancing the collection in place of obj.'''
+    instance = bpy.data.objects.new(obj.name, None)
+    instance.instance_type = 'COLLECTION'
+    instance.instance_collection = collection
+    instance.empty_display_size = obj.dimensions.length / 4 or 1.0
+    for users_collection in obj.users_collection:
+        users_collection.objects.link(instance)
+    instance.parent = obj.parent
+    instance.matrix_parent_inverse = obj.matrix_parent_inverse
+    instance.matrix_basis = obj.matrix_basis
+    return instance
+
+def _new_point_instances(members, source):
+    '''Create one point cloud object with a point per member, carrying the
+    member transforms, and instance the source on it with Geometry Nodes.'''
+    first = members[0]
+    parents = {obj.parent for obj in members}
+    parent = parents.pop() if len(parents) == 1 else None
+    to_local = parent.matrix_world.inverted_safe() if parent is not None else mathutils.Matrix.Identity(4)
+
+    n = len(members)
+    co = [0.0] * (n * 3)
+    rotations = [0.0] * (n * 4)
+    scales = [0.0] * (n * 3)
+    for i, obj in enumerate(members):
+        location, rotation, scale = _decompose(to_local @ obj.matrix_world)
+        co[i * 3:i * 3 + 3] = location
+        rotations[i * 4:i * 4 + 4] = rotation
+        scales[i * 3:i * 3 + 3] = scale
+
+    mesh = bpy.data.meshes.new(f'{first.name} Instances')
+    mesh.vertices.add(n)
+    mesh.vertices.foreach_set('co', co)
+    mesh.attributes.new('instance_rotation', 'QUATERNION', 'POINT').data.foreach_set('value', rotations)
+    mesh.attributes.new('instance_scale', 'FLOAT_VECTOR', 'POINT').data.foreach_set('vector', scales)
+    mesh.update()
+
+    points = bpy.data.objects.new(mesh.name, mesh)
+    for users_collection in first.users_collection:
+        users_collection.objects.link(points)
+    points.parent = parent
+
+    node_group = _instance_node_group()
+    modifier = points.modifiers.new('CAD Instances', 'NODES')
+    modifier.node_group = node_group
+    modifier[node_group.interface.items_tree['Instance'].identifier] = source
+    return points
+
+def _decompose(matrix):
+    '''Split a transform into location, rotation quaternion and scale.
+    A mirroring transform gets a negative X scale.'''
+    if matrix.determinant() < 0:
+        location, rotation, scale = (matrix @ _MIRROR_X).decompose()
+        scale.x = -scale.x
+        return location, rotation, scale
+    return matrix.decompose()
+
+def _instance_node_group():
+    '''Get or create the node group instancing an object on the points of
+    the modified geometry, using the instance_rotation and instance_scale
+    point attributes.'''
+    group = bpy.data.node_groups.get(_NODE_GROUP_NAME)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(_NODE_GROUP_NAME, 'GeometryNodeTree')
+    group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+    group.interface.new_socket('Instance', in_out='INPUT', socket_type='NodeSocketObject')
+    group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+
+    nodes = group.nodes
+    links = group.links
+    group_input = nodes.new('NodeGroupInput')
+    group_input.location = (-600, 0)
+    object_info = nodes.new('GeometryNodeObjectInfo')
+    object_info.transform_space = 'ORIGINAL'
+    object_info.location = (-400, -100)
+    rotation = nodes.new('GeometryNodeInputNamedAttribute')
+    rotation.data_type = 'QUATERNION'
+    rotation.inputs['Name'].default_value = 'instance_rotation'
+    rotation.location = (-400, -300)
+    scale = nodes.new('GeometryNodeInputNamedAttribute')
+    scale.data_type = 'FLOAT_VECTOR'
+    scale.inputs['Name'].default_value = 'instance_scale'
+    scale.location = (-400, -450)
+    instance_on_points = nodes.new('GeometryNodeInstanceOnPoints')
+    instance_on_points.location = (-100, 0)
+    group_output = nodes.new('NodeGroupOutput')
+    group_output.location = (150, 0)
+
+    links.new(group_input.outputs['Geometry'], instance_on_points.inputs['Points'])
+    links.new(group_input.outputs['Instance'], object_info.inputs['Object'])
+    links.new(object_info.outputs['Geometry'], instance_on_points.inputs['Instance'])
+    links.new(rotation.outputs['Attribute'], instance_on_points.inputs['Rotation'])
+    links.new(scale.outputs['Attribute'], instance_on_points.inputs['Scale'])
+    links.new(instance_on_points.outputs['Instances'], group_output.inputs['Geometry'])
+    return group
+
+def report_instance_result(op, n_collections, result):
+    replaced, created, freed, freed_bytes = result
+    shared_functions.report_info(
+        op,
+        f'Instanced {n_collections} collections: replaced {replaced} objects by {created} instance objects, '
+        f'freed {freed} data-blocks (~{freed_bytes / 1024 ** 2:.1f} MB)',
+        )
+
+
+##############################################################################
+# Sub-Assembly Instancing
+##############################################################################
+# Every object below the selection gets a hash of its subtree, computed
+# bottom-up in one post-order pass: its own geometry (mesh fingerprint),
+# materials and modifiers plus the hashes and relative transforms of its
+# children. Empties with identical hashes are identical sub-assemblies.
+
+def find_identical_assemblies(roots, scene):
+    '''Find identical sub-assemblies (empties with children) below the roots.
+
+    Returns groups of subtrees (lists of objects, the assembly empty first),
+    largest assemblies first. Only maximal assemblies are kept: an assembly
+    inside an already found one is not reported again.
+    '''
+    children = shared_functions.children_map(list(scene.objects))
+    order = []
+    for root in shared_functions.topmost_objects(roots):
+        order.extend(shared_functions.subtree(root, children))
+
+    meshes, _ = unique_meshes(order)
+    fingerprints = get_mesh_descriptors('fingerprint', meshes, scene)
+    fingerprints = {mesh.as_pointer(): f for mesh, f in zip(meshes, fingerprints)}
+
+    # pre-order reversed: children are hashed before their parents
+    precision = scene.cad_fingerprint_precision
+    hashes = {}
+    sizes = {}
+    for ob in reversed(order):
+        kids = children[ob]
+        hashes[ob] = instance_detection.assembly_hash(
+            _assembly_node_key(ob, fingerprints),
+            [(hashes[kid], [v for row in kid.matrix_local for v in row]) for kid in kids],
+            precision,
+            )
+        sizes[ob] = 1 + sum(sizes[kid] for kid in kids)
+
+    groups = {}
+    for ob in order:
+        if ob.type == 'EMPTY' and children[ob]:
+            groups.setdefault(hashes[ob], []).append(ob)
+    candidates = sorted(
+        (group for group in groups.values() if len(group) > 1),
+        key=lambda group: (-sizes[group[0]], min(ob.name for ob in group)),
+        )
+
+    covered = set()
+    found = []
+    for group in candidates:
+        group = sorted((ob for ob in group if ob not in covered), key=lambda ob: ob.name)
+        if len(group) < 2:
+            continue
+        subtrees = [shared_functions.subtree(ob, children) for ob in group]
+        for objects in subtrees:
+            covered.update(objects)
+        found.append(subtrees)
+    return found
+
+def _assembly_node_key(ob, fingerprints):
+    '''Bytes describing a single object of a sub-assembly.'''
+    parts = [ob.type]
+    if ob.type == 'EMPTY':
+        parts.append(ob.instance_type)
+        parts.append(ob.instance_collection.name if ob.instance_collection else '')
+    elif ob.type != 'MESH' and ob.data is not None:
+        # other data is only identical if it is shared
+        parts.append(ob.data.name)
+    parts.extend(slot.material.name if slot.material else '' for slot in ob.material_slots)
+    parts.extend(modifier.type for modifier in ob.modifiers)
+    key = '\0'.join(parts).encode()
+    if ob.type == 'MESH':
+        key += fingerprints[ob.data.as_pointer()]
+    return key
+
+def instance_assemblies(groups, context):
+    '''Replace every group of identical sub-assemblies (see
+    find_identical_assemblies) by collection instances.
+
+    The first assembly of a group is moved into a source collection, with
+    its root at the origin. Every assembly root is replaced by an empty
+    instancing that collection, the other assemblies are removed.
+
+    Returns (number of instanced assemblies, number of removed objects,
+    number of freed data-blocks, estimated number of freed bytes).
+    '''
+    removed = []
+    renames = []
+    for subtrees in groups:
+        source_objects = subtrees[0]
+        source = source_objects[0]
+        collection = _new_source_collection(context, source)
+        for objects in subtrees:
+            renames.append((_new_collection_instance(objects[0], collection), objects[0].name))
+        for ob in source_objects:
+            for users_collection in list(ob.users_collection):
+                users_collection.objects.unlink(ob)
+            collection.objects.link(ob)
+        source.name = f'{source.name} Source'
+        source.parent = None
+        source.matrix_parent_inverse = mathutils.Matrix.Identity(4)
+        source.matrix_basis = mathutils.Matrix.Identity(4)
+        for objects in subtrees[1:]:
+            removed.extend(objects)
+
+    data = {ob.data.as_pointer(): ob.data for ob in removed if ob.data is not None}
+    if removed:
+        bpy.data.batch_remove(removed)
+    for instance, name in renames:
+        instance.name = name
+
+    unused = [d for d in data.values() if d.users == 0]
+    freed_bytes = sum(estimate_data_bytes(d) for d in unused)
+    if unused:
+        bpy.data.batch_remove(unused)
+    return len(renames), len(removed), len(unused), freed_bytes
+
+
+##############################################################################
+# Shape Similarity Index
+##############################################################################
+# Shape descriptors (see instance_detection.shape_descriptors) of all
+# candidate objects are stacked into one array. The array is kept for the
+# next query as long as the candidates and their change stamps stay the same,
+# so only the first query pays for building it. The stamps are not reset by
+# undo steps (unlike the session cache), so changing the options of Find
+# Similar Parts in the redo panel reuses the index.
+
+_similarity_index = None
+
+def get_similarity_index(objects, scene):
+    '''Return the shape descriptor rows of the unique meshes of objects, the
+    object session UIDs per row and a dict of object session UID -> row.'''
+    global _similarity_index
+    key = tuple(_object_stamp(ob) for ob in objects)
+    if _similarity_index is not None and _similarity_index[0] == key:
+        return _similarity_index[1]
+
+    np = instance_detection.np
+    with scan_meshes(objects) as (meshes, mesh_objects):
+        rows = get_mesh_descriptors('shape', meshes, scene)
+        row_uids = [[ob.session_uid for ob in mesh_objects[mesh.as_pointer()]] for mesh in meshes]
+    rows = np.array(rows, dtype=np.float64).reshape(-1, instance_detection.SHAPE_COLUMNS)
+    row_of = {uid: row for row, uids in enumerate(row_uids) for uid in uids}
+    _similarity_index = (key, (rows, row_uids, row_of))
+    return _similarity_index[1]
+
+def _clear_similarity_index():
+    global _similarity_index
+    _similarity_index = None
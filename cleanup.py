@@ -5,6 +5,7 @@ import mathutils
 import math
 import time
 from . import shared_functions
+from . import instance_detection
 
 ##############################################################################
 # Panel
@@ -49,6 +50,14 @@ class CAD_CLEAN_HELPER_PT_Cleanup(bpy.types.Panel):
             'object.delete_child_empties_without_children',
             icon='OUTLINER_DATA_EMPTY'
             )
+        layout.operator(
+            'object.collapse_single_child_empties',
+            icon='OUTLINER_OB_EMPTY'
+            )
+        layout.operator(
+            'object.remove_coincident_duplicates',
+            icon='DUPLICATE'
+            )
         layout.operator(
             'object.flatten_hierarchy',
             icon='OUTLINER'
@@ -127,8 +136,9 @@ class CAD_CLEAN_HELPER_PT_MeshCleanup(bpy.types.Panel):
 ##############################################################################
 
 class DeleteAndReparentChildren(bpy.types.Operator):
-    '''Reconnects all the children of an object to it's
-    parent (if available) before deleting the object.
+    '''Reconnects all the children of the selected objects to
+    their nearest remaining parent before deleting the objects
+    (children of root objects become roots), in place.
     This allows to keep the hierarchy when
     deleting objects from a structured assebly.'''
     bl_idname = 'object.delete_and_reparent_children'
@@ -145,28 +155,16 @@ class DeleteAndReparentChildren(bpy.types.Operator):
             self.report({'INFO'}, 'No objects were selected. Nothing done...')
             return {'CANCELLED'}
 
-        for object in context.selected_objects:
-            self.delete_and_reconnect(object)
-
+        objects = list(context.selected_objects)
+        n_children = shared_functions.delete_and_reparent(objects)
+        self.report({'INFO'}, f'Removed {len(objects)} objects, re-parented {n_children} children')
         return {'FINISHED'}
 
-    def delete_and_reconnect(self, object):
-        parent = object.parent
-
-        if parent is not None:
-            # executes only if object has a parent
-            children = object.children
-            for child in children:
-                location = child.matrix_world
-                child.parent = parent
-                child.matrix_world = location
-
-        bpy.data.objects.remove(object)
-
 
 class DeleteEmpiesWithoutChildren(bpy.types.Operator):
     '''Under selected root objects; recursivley
-    deletes all empties that do not have any chlidren.'''
+    deletes all empties that do not have any chlidren,
+    including empties that only have such empties below them.'''
     bl_idname = 'object.delete_child_empties_without_children'
     bl_label = 'Delete Child Empties Without Children'
     bl_options = {"REGISTER", "UNDO"}
@@ -184,21 +182,14 @@ class DeleteEmpiesWithoutChildren(bpy.types.Operator):
             self.report({'INFO'}, 'No objects selected')
             return {'CANCELLED'}
 
-        # collect leaf empty children
-        sel = []
-        for obj in init_selection:
-            for child in obj.children_recursive:
-                if child.type == 'EMPTY' and len(child.children) == 0 and child not in sel:
-                    sel.append(child)
-
-        counter = 0
-        while sel:
-            obj = sel.pop(0)
-            if obj in init_selection:
-                init_selection.remove(obj)
-            # remove object from data
-            bpy.data.objects.remove(obj)
-            counter += 1
+        removable = empty_only_descendants(init_selection)
+        counter = len(removable)
+        # drop references before the objects are removed
+        init_selection = [obj for obj in init_selection if obj not in removable]
+        if _active in removable:
+            _active = None
+        if removable:
+            bpy.data.batch_remove(list(removable))
 
         # restore selection (avoid bpy.ops)
         for o in context.view_layer.objects:
@@ -213,13 +204,99 @@ class DeleteEmpiesWithoutChildren(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class CollapseSingleChildEmpties(bpy.types.Operator):
+    '''Under selected root objects; removes all empties
+    that have exactly one child (e.g. Empty > Empty > Mesh chains).
+    The remaining child keeps its placement.'''
+    bl_idname = 'object.collapse_single_child_empties'
+    bl_label = 'Collapse Single-Child Empties'
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.selected_objects
+
+    def execute(self, context):
+        init_selection = list(context.selected_objects)
+        empties = single_child_empties(init_selection)
+        if not empties:
+            self.report({'INFO'}, 'No single-child empties found')
+            return {'FINISHED'}
+
+        shared_functions.delete_and_reparent(empties)
+        self.report({'INFO'}, f'Removed {len(empties)} single-child empties')
+        return {'FINISHED'}
+
+
+class RemoveCoincidentDuplicates(bpy.types.Operator):
+    '''Finds selected mesh objects that are duplicates of another one at the
+    same place (same world-space geometry) and deletes or selects the
+    redundant copies. Children of deleted copies are re-parented to the
+    nearest remaining parent.'''
+    bl_idname = 'object.remove_coincident_duplicates'
+    bl_label = 'Remove Coincident Duplicates'
+    bl_options = {"REGISTER", "UNDO"}
+
+    action: bpy.props.EnumProperty(
+        name='Action',
+        items=[
+            ('DELETE', 'Delete', 'Delete the redundant copies'),
+            ('SELECT', 'Select', 'Only select the redundant copies'),
+            ],
+        default='DELETE',
+        )
+    distance: bpy.props.FloatProperty(
+        name='Distance',
+        description='Largest distance between matching bounding box corners and vertices',
+        default=1e-4,
+        min=1e-9,
+        soft_max=0.01,
+        precision=6,
+        subtype='DISTANCE',
+        )
+
+    @classmethod
+    def poll(cls, context):
+        return context.selected_objects
+
+    def execute(self, context):
+        # instance empties and other non-mesh objects are never touched
+        objects = [ob for ob in context.selected_objects if ob.type == 'MESH']
+        duplicates = find_coincident_duplicates(objects, self.distance)
+        if not duplicates:
+            self.report({'INFO'}, 'No coincident duplicates found')
+            return {'FINISHED'}
+
+        if self.action == 'SELECT':
+            for ob in context.selected_objects:
+                ob.select_set(False)
+            for ob in duplicates:
+                ob.select_set(True)
+            self.report({'INFO'}, f'Selected {len(duplicates)} coincident duplicates')
+            return {'FINISHED'}
+
+        shared_functions.delete_and_reparent(duplicates)
+        self.report({'INFO'}, f'Removed {len(duplicates)} coincident duplicates')
+        return {'FINISHED'}
+
+
 class FlattenHierarchy(bpy.types.Operator):
     '''Flattens hierarchy, so that all of the childrend
-    below a selected node(s) are on the same level.'''
+    below a selected node(s) are on the same level.
+    Optionally, the top sub-assembly levels are kept.'''
     bl_idname = 'object.flatten_hierarchy'
     bl_label = 'Flatten Hierarchy'
     bl_options = {"REGISTER", "UNDO"}
 
+    keep_levels: bpy.props.IntProperty(
+        name='Keep Levels',
+        description='Number of levels below the selected objects that are kept, '
+                    'everything deeper is moved up to the last kept level (0 flattens completely)',
+        default=0,
+        min=0,
+        soft_max=10,
+        )
+
     @classmethod
     def poll(cls, context):
         return context.selected_objects
@@ -227,11 +304,7 @@ class FlattenHierarchy(bpy.types.Operator):
     def execute(self, context):
         init_selection = context.selected_objects
 
-        for root in init_selection:
-            for child in root.children_recursive:
-                location = child.matrix_world
-                child.parent = root
-                child.matrix_world = location
+        flatten_hierarchy(init_selection, self.keep_levels)
 
         return {'FINISHED'}
 
@@ -240,7 +313,8 @@ class FlattenJoinHierarchy(bpy.types.Operator):
     '''Flattens hierarchy and join all of the child mesh objects,
     so that all of the children below a selected object(s)
     are on the same level.
-    All modifiers are applied before joining.'''
+    All modifiers are applied before joining.
+    Vertex groups and shape keys are not kept.'''
     bl_idname = 'object.flatten_and_join_hierarchy'
     bl_label = 'Flatten and Join Hierarchy'
     bl_options = {"REGISTER", "UNDO"}
@@ -252,13 +326,9 @@ class FlattenJoinHierarchy(bpy.types.Operator):
     def execute(self, context):
         init_selection = context.selected_objects
 
-        for root in init_selection:
-            all_children = root.children_recursive
-            for child in all_children:
-                location = child.matrix_world
-                child.parent = root
-                child.matrix_world = location
-            shared_functions.apply_modifiers_and_join(context, all_children)
+        for root, all_children in flatten_hierarchy(init_selection).items():
+            if all_children:
+                shared_functions.apply_modifiers_and_join(context, all_children)
 
         return {'FINISHED'}
 
@@ -322,6 +392,16 @@ class CenterEmptiesToChildren(bpy.types.Operator):
     bl_label = 'Center Empties to Children'
     bl_options = {"REGISTER", "UNDO"}
 
+    mode: bpy.props.EnumProperty(
+        name='Center',
+        items=[
+            ('ORIGIN', 'Origins', 'Average of the origins of all objects below the empty'),
+            ('BBOX', 'Bounding Box', 'Center of the bounding box of all objects below the empty'),
+            ('VOLUME', 'Volume', 'Center of mass of all meshes below the empty (uniform density)'),
+            ],
+        default='ORIGIN',
+        )
+
     @classmethod
     def poll(cls, context):
         return context.selected_objects
@@ -329,35 +409,17 @@ class CenterEmptiesToChildren(bpy.types.Operator):
     def execute(self, context):
         init_selection = context.selected_objects
 
-        for root in init_selection:
-            if root.type == 'EMPTY' and root.children_recursive:
-                # save the location of the direct children
-                pos = {}
-                for chld in root.children:
-                    pos[chld] = chld.matrix_world
-
-                # calculate the root average location based on all of the children
-                all_children = root.children_recursive
-                x = 0
-                y = 0
-                z = 0
-                n = 0
-                for child in all_children:
-                    x += child.matrix_world.translation[0]
-                    y += child.matrix_world.translation[1]
-                    z += child.matrix_world.translation[2]
-                    n += 1
-                # calculate average position
-                x = x/n
-                y = y/n
-                z = z/n
-
-                # Set the object's matrix_world attribute to the new matrix
-                root.matrix_world.translation = mathutils.Vector((x,y,z))
-
-                # reset the children's position to the previously saved location
-                for chld in root.children:
-                    chld.matrix_world = pos[chld]
+        centers = children_centers(init_selection, self.mode)
+        empties = [
+            root for root in init_selection
+            if root.type == 'EMPTY' and centers.get(root) is not None
+            ]
+        worlds = []
+        for root in empties:
+            world = root.matrix_world.copy()
+            world.translation = centers[root]
+            worlds.append(world)
+        shared_functions.set_world_matrices(empties, worlds)
 
         return {'FINISHED'}
 
@@ -569,7 +631,7 @@ class CleanupSelectedMeshes(bpy.types.Operator):
             return False
         mesh_key = mesh.as_pointer()
 
-        # Clearing custom split normals still requires mesh edit operator behavior.
+        # Normally already cleared in one batch by _batch_clear_custom_split_normals.
         if (
             self._op_clear
             and mesh_key not in self._cleared_normals_mesh_keys
@@ -605,17 +667,11 @@ class CleanupSelectedMeshes(bpy.types.Operator):
             self._apply_shade_smooth(context, inst, angle)
 
     def _clear_custom_split_normals(self, context, obj):
-        self._activate_only(context, obj)
-        bpy.ops.object.mode_set(mode='EDIT')
-        try:
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.customdata_custom_splitnormals_clear()
-        finally:
-            bpy.ops.object.mode_set(mode='OBJECT')
+        clear_custom_normals(obj.data)
         self._mark_mesh_normals_cleared(obj)
 
     def _batch_clear_custom_split_normals(self, context):
-        targets = []
+        # Data API only: no mode switches, selection or active object changes.
         for obj in self._mesh_objects:
             if obj.name not in context.view_layer.objects:
                 continue
@@ -624,44 +680,7 @@ class CleanupSelectedMeshes(bpy.types.Operator):
                 continue
             if not getattr(mesh, 'has_custom_normals', False):
                 continue
-            targets.append(obj)
-
-        if not targets:
-            return
-
-        for obj in targets:
-            obj.select_set(True)
-
-        context.view_layer.objects.active = targets[0]
-        self._current_active_obj = targets[0]
-
-        try:
-            bpy.ops.object.mode_set(mode='EDIT')
-            try:
-                bpy.ops.mesh.select_all(action='SELECT')
-                bpy.ops.mesh.customdata_custom_splitnormals_clear()
-            finally:
-                bpy.ops.object.mode_set(mode='OBJECT')
-
-            for obj in targets:
-                self._mark_mesh_normals_cleared(obj)
-        except Exception:
-            for obj in targets:
-                if obj.name not in context.view_layer.objects:
-                    continue
-                mesh = getattr(obj, 'data', None)
-                if mesh is None:
-                    continue
-                if not getattr(mesh, 'has_custom_normals', False):
-                    continue
-                self._clear_custom_split_normals(context, obj)
-
-        try:
-            bpy.ops.object.select_all(action='DESELECT')
-        except Exception:
-            for scene_obj in context.view_layer.objects:
-                scene_obj.select_set(False)
-        self._current_active_obj = None
+            self._clear_custom_split_normals(context, obj)
 
     def _mark_mesh_normals_cleared(self, obj):
         mesh = getattr(obj, 'data', None)
@@ -879,6 +898,245 @@ class CleanupSelectedMeshes(bpy.types.Operator):
                 pass
 
 
+##############################################################################
+# Hierarchy
+##############################################################################
+# The parent -> children map is built once per operation (see
+# shared_functions.children_map) and the hierarchy below the topmost
+# selected roots is walked once.
+
+def flatten_hierarchy(roots, keep_levels=0):
+    '''Move every object more than keep_levels below one of the topmost
+    roots up to its ancestor on the last kept level (the root itself for 0),
+    keeping its placement.
+
+    The hierarchy is walked once and all objects are re-parented in one
+    batch (see shared_functions.reparent).
+    Returns a dict of topmost root -> all its descendants.
+    '''
+    children = shared_functions.children_map(list(bpy.data.objects))
+    descendants = {}
+    objects = []
+    parents = []
+    for root in shared_functions.topmost_objects(roots):
+        descendants[root] = []
+        stack = [(child, 1, root) for child in children[root]]
+        while stack:
+            ob, depth, anchor = stack.pop()
+            descendants[root].append(ob)
+            if depth > keep_levels and ob.parent != anchor:
+                objects.append(ob)
+                parents.append(anchor)
+            # the last kept level becomes the new parent of everything below
+            below = ob if depth == keep_levels else anchor
+            stack.extend((child, depth + 1, below) for child in children[ob])
+    shared_functions.reparent(objects, parents)
+    return descendants
+
+
+def empty_only_descendants(roots):
+    '''Return the set of empties below the roots whose subtree contains
+    nothing but empties (leaf empties included), in one post-order pass.
+    The roots themselves and collection instance empties are kept.'''
+    children = shared_functions.children_map(list(bpy.data.objects))
+    removable = set()
+    for root in shared_functions.topmost_objects(roots):
+        # pre-order reversed: children are visited before their parents
+        for ob in reversed(shared_functions.subtree(root, children)[1:]):
+            if (
+                ob.type == 'EMPTY'
+                and ob.instance_type != 'COLLECTION'
+                and all(child in removable for child in children[ob])
+            ):
+                removable.add(ob)
+    return removable
+
+
+def single_child_empties(roots):
+    '''Return the empties below the roots that have exactly one child, in one
+    pass. The roots themselves and collection instance empties are kept.'''
+    children = shared_functions.children_map(list(bpy.data.objects))
+    empties = []
+    for root in shared_functions.topmost_objects(roots):
+        for ob in shared_functions.subtree(root, children)[1:]:
+            if ob.type == 'EMPTY' and ob.instance_type != 'COLLECTION' and len(children[ob]) == 1:
+                empties.append(ob)
+    return empties
+
+
+def children_centers(roots, mode='ORIGIN'):
+    '''Return a dict of object -> world-space center of all its descendants
+    (None if it has none), for every object below the topmost roots.
+
+    mode: 'ORIGIN' (average origin), 'BBOX' (bounding box center of the
+    geometry) or 'VOLUME' (volume centroid of the meshes). Without geometry
+    (or without volume) below an object, its average origin is used.
+    Sums are aggregated bottom-up in one post-order pass.
+    '''
+    children = shared_functions.children_map(list(bpy.data.objects))
+    volumes = {}
+    # per subtree (object included): origin sum, origin count, geometry aggregate
+    subtrees = {}
+    centers = {}
+    for root in shared_functions.topmost_objects(roots):
+        # pre-order reversed: children are visited before their parents
+        for ob in reversed(shared_functions.subtree(root, children)):
+            origin_sum = mathutils.Vector()
+            origin_count = 0
+            geometry = None
+            for child in children[ob]:
+                child_sum, child_count, child_geometry = subtrees[child]
+                origin_sum += child_sum
+                origin_count += child_count
+                geometry = _merge_geometry(mode, geometry, child_geometry)
+            if origin_count == 0:
+                centers[ob] = None
+            elif geometry is None:
+                centers[ob] = origin_sum / origin_count
+            elif mode == 'BBOX':
+                centers[ob] = (mathutils.Vector(geometry[:3]) + mathutils.Vector(geometry[3:])) / 2
+            else:
+                centers[ob] = geometry[0] / geometry[1]
+            own = _own_geometry(mode, ob, volumes)
+            subtrees[ob] = (
+                origin_sum + ob.matrix_world.translation,
+                origin_count + 1,
+                _merge_geometry(mode, geometry, own),
+                )
+    return centers
+
+def _own_geometry(mode, ob, volumes):
+    # world bounds for BBOX, (volume weighted centroid sum, volume) for VOLUME
+    if mode == 'BBOX':
+        return world_bounds(ob) if ob.type in _GEOMETRY_TYPES else None
+    if mode == 'VOLUME' and ob.type == 'MESH':
+        key = ob.data.as_pointer()
+        if key not in volumes:
+            volumes[key] = mesh_volume(ob.data)
+        volume, centroid = volumes[key]
+        volume = abs(volume * ob.matrix_world.to_3x3().determinant())
+        if volume > 0.0:
+            return (volume * (ob.matrix_world @ centroid), volume)
+    return None
+
+def _merge_geometry(mode, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if mode == 'BBOX':
+        return tuple(min(a[i], b[i]) for i in range(3)) + tuple(max(a[i], b[i]) for i in range(3, 6))
+    return (a[0] + b[0], a[1] + b[1])
+
+def mesh_volume(mesh):
+    '''Return the signed volume and the volume centroid (local space) of a
+    closed mesh, summed over the tetrahedra of its triangles and the origin.'''
+    np = instance_detection.np
+    mesh.calc_loop_triangles()
+    if np is not None:
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.vertices.foreach_get('co', co)
+        mesh.loop_triangles.foreach_get('vertices', triangles)
+        corners = co.reshape(-1, 3).astype(np.float64)[triangles.reshape(-1, 3)]
+        volumes = np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])) / 6.0
+        volume = float(volumes.sum())
+        if volume == 0.0:
+            return 0.0, mathutils.Vector()
+        return volume, mathutils.Vector((volumes @ corners.sum(axis=1)) / (4.0 * volume))
+    vertices = mesh.vertices
+    volume = 0.0
+    weighted = mathutils.Vector()
+    for triangle in mesh.loop_triangles:
+        a, b, c = (vertices[i].co for i in triangle.vertices)
+        v = a.dot(b.cross(c)) / 6.0
+        volume += v
+        weighted += v * (a + b + c) / 4.0
+    if volume == 0.0:
+        return 0.0, mathutils.Vector()
+    return volume, weighted / volume
+
+
+##############################################################################
+# Coincident Duplicates
+##############################################################################
+# Candidates are found by hashing world-space bounding boxes (linear time,
+# see instance_detection.coincident_groups). Only candidates are confirmed
+# by comparing their topology and index-matched world-space vertices, so
+# the vertices of most objects are never read.
+
+# Object types with geometry (bounding box)
+_GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}
+
+def world_bounds(ob):
+    '''World-space axis-aligned bounding box (min x, y, z, max x, y, z).'''
+    matrix = ob.matrix_world
+    corners = [matrix @ mathutils.Vector(corner) for corner in ob.bound_box]
+    return (
+        min(c.x for c in corners), min(c.y for c in corners), min(c.z for c in corners),
+        max(c.x for c in corners), max(c.y for c in corners), max(c.z for c in corners),
+        )
+
+def world_points(ob, buffers):
+    '''World-space vertex positions of a mesh object as an (n, 3) array
+    (list of vectors without NumPy), from its mesh buffers.'''
+    np = instance_detection.np
+    co = buffers[0]
+    matrix = ob.matrix_world
+    if np is not None:
+        m = np.array(matrix, dtype=np.float64)
+        return np.asarray(co, dtype=np.float64).reshape(-1, 3) @ m[:3, :3].T + m[:3, 3]
+    return [matrix @ mathutils.Vector(co[i:i + 3]) for i in range(0, len(co), 3)]
+
+def _same_topology(a, b):
+    # equal vertex count, polygon sizes and corner vertex indices
+    return len(a[0]) == len(b[0]) and bytes(a[1]) == bytes(b[1]) and bytes(a[2]) == bytes(b[2])
+
+def find_coincident_duplicates(objects, distance):
+    '''Return the redundant copies among the mesh objects: objects with the
+    same topology as another one and every vertex within distance of its
+    counterpart in world space. Of every group of copies, the object with
+    the first name is kept.'''
+    objects = sorted(objects, key=lambda ob: ob.name)
+    boxes = [world_bounds(ob) for ob in objects]
+    buffers = {}
+
+    def mesh_buffers(ob):
+        key = ob.data.as_pointer()
+        if key not in buffers:
+            buffers[key] = shared_functions.get_mesh_buffers(ob.data)
+        return buffers[key]
+
+    duplicates = []
+    for group in instance_detection.coincident_groups(boxes, distance):
+        kept = []  # (buffers, world points) of the kept objects
+        for i in group:
+            ob_buffers = mesh_buffers(objects[i])
+            points = world_points(objects[i], ob_buffers)
+            if any(
+                _same_topology(ob_buffers, kept_buffers)
+                and instance_detection.max_point_distance(points, kept_points) <= distance
+                for kept_buffers, kept_points in kept
+            ):
+                duplicates.append(objects[i])
+            else:
+                kept.append((ob_buffers, points))
+        buffers.clear()
+    return duplicates
+
+
+def clear_custom_normals(mesh):
+    '''Remove the custom normals of a mesh through the data API (no edit mode).'''
+    attribute = mesh.attributes.get('custom_normal')
+    if attribute is not None:
+        mesh.attributes.remove(attribute)
+    elif mesh.has_custom_normals:
+        # custom normals not stored as a generic attribute: zero vectors
+        # reset every corner to its automatic normal
+        mesh.normals_split_custom_set([(0.0, 0.0, 0.0)] * len(mesh.loops))
+    mesh.update()
+
+
 def _default_merge_distance():
     # Query Blender operator RNA so default tracks Blender version changes.
     try:
@@ -897,6 +1155,8 @@ classes = (
     CAD_CLEAN_HELPER_PT_MeshCleanup,
     DeleteAndReparentChildren,
     DeleteEmpiesWithoutChildren,
+    CollapseSingleChildEmpties,
+    RemoveCoincidentDuplicates,
     FlattenHierarchy,
     FlattenJoinHierarchy,
     NormEmptySize,
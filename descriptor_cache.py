@@ -0,0 +1,157 @@
+# GPL-3.0 license
+
+'''On-disk cache of instance detection descriptors.
+
+The cache is a single memory-mapped file of fixed-size records next to the
+.blend file, so reopening a file and rescanning only computes the
+descriptors of meshes whose geometry changed. This module does not use
+bpy; it requires NumPy (the cache is disabled without it).
+
+File layout:
+    header (64 bytes): magic, version, record size, record count, clock
+    records: key (16 bytes), checksum (16 bytes), last use (clock value),
+             value (up to 168 bytes)
+
+A record key is a hash of the mesh name and the descriptor kind, the
+checksum is a hash of the mesh geometry. A record is only used if both
+match. When the file is full, the least recently used records are evicted.
+'''
+
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+MAGIC = b'CADHDC\0\0'
+# also bumped when a descriptor changes, so stale records are discarded
+# 2: pose descriptors with chirality
+VERSION = 2
+
+_HEADER = struct.Struct('<8sIIQQ')
+_HEADER_SIZE = 64
+_VALUE_SIZE = 168
+_EMPTY_KEY = bytes(16)
+
+# share of the records evicted at once when the file is full
+_EVICT_FRACTION = 0.1
+
+if np is not None:
+    RECORD = np.dtype([
+        ('key', 'V16'),
+        ('checksum', 'V16'),
+        ('used', '<u8'),
+        ('value', 'V%d' % _VALUE_SIZE),
+    ])
+
+
+def encode_value(value):
+    '''Pack a descriptor (tuple of floats or digest bytes) into record bytes.'''
+    if isinstance(value, bytes):
+        data = b'B' + bytes([len(value)]) + value
+    else:
+        data = b'F' + bytes([len(value)]) + struct.pack('<%dd' % len(value), *value)
+    if len(data) > _VALUE_SIZE:
+        raise ValueError('Descriptor too large for the cache')
+    return data.ljust(_VALUE_SIZE, b'\0')
+
+
+def decode_value(data):
+    data = bytes(data)
+    n = data[1]
+    if data[:1] == b'B':
+        return data[2:2 + n]
+    return struct.unpack_from('<%dd' % n, data, 2)
+
+
+class DescriptorCache:
+    '''Memory-mapped descriptor records in one file of at most max_bytes.
+
+    The file is (re)created if it is missing, has another version or another
+    capacity.
+    '''
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.capacity = max(1, (max_bytes - _HEADER_SIZE) // RECORD.itemsize)
+        self.clock = 0
+        if not self._open_existing():
+            self._create()
+        keys = self.records['key']
+        self.index = {}
+        for slot in np.flatnonzero(keys != np.void(_EMPTY_KEY)).tolist():
+            self.index[bytes(keys[slot])] = slot
+        self.free = np.flatnonzero(keys == np.void(_EMPTY_KEY)).tolist()[::-1]
+
+    def _open_existing(self):
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(_HEADER.size)
+        except OSError:
+            return False
+        if len(header) != _HEADER.size:
+            return False
+        magic, version, record_size, capacity, clock = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize or capacity != self.capacity:
+            return False
+        if os.path.getsize(self.path) != _HEADER_SIZE + capacity * RECORD.itemsize:
+            return False
+        self.records = np.memmap(self.path, dtype=RECORD, mode='r+', offset=_HEADER_SIZE, shape=(capacity,))
+        self.clock = clock
+        return True
+
+    def _create(self):
+        with open(self.path, 'wb') as f:
+            f.write(self._header().ljust(_HEADER_SIZE, b'\0'))
+            f.truncate(_HEADER_SIZE + self.capacity * RECORD.itemsize)
+        self.records = np.memmap(self.path, dtype=RECORD, mode='r+', offset=_HEADER_SIZE, shape=(self.capacity,))
+
+    def _header(self):
+        return _HEADER.pack(MAGIC, VERSION, RECORD.itemsize, self.capacity, self.clock)
+
+    def get(self, key, checksum):
+        '''Return the cached descriptor for key, or None if it is missing or
+        the checksum differs.'''
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        record = self.records[slot]
+        if bytes(record['checksum']) != checksum:
+            return None
+        self.clock += 1
+        self.records['used'][slot] = self.clock
+        return decode_value(record['value'])
+
+    def put(self, key, checksum, value):
+        slot = self.index.get(key)
+        if slot is None:
+            if not self.free:
+                self._evict()
+            slot = self.free.pop()
+            self.index[key] = slot
+        self.clock += 1
+        self.records[slot] = (key, checksum, self.clock, encode_value(value))
+
+    def _evict(self):
+        # drop the least recently used records in one go
+        n = max(1, int(self.capacity * _EVICT_FRACTION))
+        used = self.records['used']
+        victims = np.argpartition(used, n - 1)[:n] if n < self.capacity else np.arange(self.capacity)
+        for slot in victims.tolist():
+            self.index.pop(bytes(self.records['key'][slot]), None)
+        self.records['key'][victims] = np.void(_EMPTY_KEY)
+        self.free.extend(victims.tolist())
+
+    def flush(self):
+        self.records.flush()
+        with open(self.path, 'r+b') as f:
+            f.write(self._header())
+
+    def close(self):
+        self.flush()
+        del self.records
@@ -0,0 +1,712 @@
+# GPL-3.0 license
+'''Geometry math used by the instance detection operators.
+
+This module must not import bpy, so it can be used outside of Blender's
+main thread and tested without a running Blender instance.
+'''
+import array
+import concurrent.futures
+import hashlib
+import itertools
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Order of the columns of a metric row (see LinkObjData.get_object_metrics).
+METRIC_KEYS = (
+    'vertex_count',
+    'x_min',
+    'x_max',
+    'y_min',
+    'y_max',
+    'z_min',
+    'z_max',
+    'volume',
+    'surface',
+)
+
+# Columns used to build the grid keys. They are non-negative magnitudes,
+# so they can be quantized in log space (relative tolerances).
+METRIC_KEY_COLUMNS = (0, 7, 8)
+
+_EPS = 1e-8
+
+
+##############################################################################
+# Metric Binning
+##############################################################################
+
+def metrics_to_row(metrics):
+    '''Convert a metric dict to a row tuple in METRIC_KEYS order.'''
+    return tuple(metrics[k] for k in METRIC_KEYS)
+
+
+def _grid_cells(value, tol):
+    '''Return the grid cells that may contain a representative matching value.
+
+    A representative r matches a value v if |v - r| <= tol * max(|r|, eps).
+    Magnitudes are quantized in log space with a cell width of twice the
+    largest possible log distance of a match, so every match lies either in
+    the cell of v or in its nearest neighbour cell.
+    The first returned cell is the cell of v itself.
+    '''
+    if tol <= 0.0:
+        # exact match required
+        return (value,)
+    if tol >= 1.0:
+        # everything down to zero matches, column can not be used as a key
+        return (None,)
+    step = -math.log1p(-tol)
+    width = 2.0 * step
+    pos = math.log(max(abs(value), _EPS)) / width
+    cell = math.floor(pos)
+    if pos - cell < 0.5:
+        return (cell, cell - 1)
+    return (cell, cell + 1)
+
+
+def _within_tolerance(row, rep, tolerances):
+    for v, r, tol in zip(row, rep, tolerances):
+        if abs(v - r) > tol * max(abs(r), _EPS):
+            return False
+    return True
+
+
+def _distance(row, rep):
+    # normalized distance, only used to pick the best of several candidate bins
+    return sum(abs(v - r) / max(abs(r), _EPS) for v, r in zip(row, rep))
+
+
+def bin_metrics(rows, tolerances, tie_breakers=None, key_columns=METRIC_KEY_COLUMNS):
+    '''Group metric rows into bins of rows that are equal within tolerance.
+
+    rows: sequence of metric rows (all of the same length), or a 2D NumPy
+        array (rows are then converted one at a time)
+    tolerances: relative tolerance per column (0.01 == 1%)
+    tie_breakers: optional sortable value per row (e.g. the object name),
+        used to order rows with identical metrics
+    key_columns: non-negative columns used to build the grid keys
+
+    Every row is compared against the representative (first member) of the
+    candidate bins found in the neighbouring grid cells, instead of against
+    every existing bin. Rows are processed in sorted order, so the result
+    does not depend on the order of the input rows.
+
+    Returns a list of bins, each bin being a list of row indices.
+    The first index of a bin is its representative.
+    '''
+    n = len(rows)
+    is_array = np is not None and isinstance(rows, np.ndarray)
+    if is_array:
+        # lexsort: the last key is the primary one
+        keys = [rows[:, c] for c in reversed(range(rows.shape[1]))]
+        if tie_breakers is not None:
+            rank = np.empty(n, dtype=np.int64)
+            rank[sorted(range(n), key=tie_breakers.__getitem__)] = np.arange(n)
+            keys.insert(0, rank)
+        order = np.lexsort(keys).tolist() if n else []
+    elif tie_breakers is None:
+        order = sorted(range(n), key=lambda i: tuple(rows[i]))
+    else:
+        order = sorted(range(n), key=lambda i: (tuple(rows[i]), tie_breakers[i]))
+
+    key_tols = [tolerances[c] for c in key_columns]
+    bins = []
+    reps = []
+    grid = {}
+    for i in order:
+        row = rows[i].tolist() if is_array else rows[i]
+        cells = [_grid_cells(row[c], tol) for c, tol in zip(key_columns, key_tols)]
+
+        best = None
+        best_dist = None
+        for key in itertools.product(*cells):
+            for b in grid.get(key, ()):
+                rep = reps[b]
+                if not _within_tolerance(row, rep, tolerances):
+                    continue
+                dist = _distance(row, rep)
+                if best is None or dist < best_dist or (dist == best_dist and b < best):
+                    best = b
+                    best_dist = dist
+
+        if best is None:
+            grid.setdefault(tuple(c[0] for c in cells), []).append(len(bins))
+            bins.append([i])
+            reps.append(row)
+        else:
+            bins[best].append(i)
+    return bins
+
+
+
+def split_by_match(items, match):
+    '''Split items into groups of items matching the group representative.
+
+    Every item is compared with match(representative, item) against the
+    representatives (first members) of the existing groups. It joins the
+    first matching group, otherwise it starts a new group.
+    '''
+    groups = []
+    for item in items:
+        for group in groups:
+            if match(group[0], item):
+                group.append(item)
+                break
+        else:
+            groups.append([item])
+    return groups
+
+
+def max_point_distance(a, b):
+    '''Largest distance between index-matched points of two (n, 3) point sets.'''
+    if np is not None:
+        return float(np.sqrt(((np.asarray(a) - np.asarray(b)) ** 2).sum(axis=1).max(initial=0.0)))
+    return max((math.dist(p, q) for p, q in zip(a, b)), default=0.0)
+
+
+def bbox_diagonal(points):
+    '''Diagonal length of the bounding box of an (n, 3) point set.'''
+    if len(points) == 0:
+        return 0.0
+    if np is not None:
+        points = np.asarray(points)
+        return float(np.linalg.norm(points.max(axis=0) - points.min(axis=0)))
+    return math.dist(
+        [min(p[k] for p in points) for k in range(3)],
+        [max(p[k] for p in points) for k in range(3)],
+        )
+
+
+# src points compared per block in within_distance, and the number of
+# elements of the distance matrix computed at once without a grid
+_NEAREST_BLOCK = 4096
+_DISTANCE_BLOCK = 1 << 22
+
+def _cell_keys(cells, dims):
+    return np.ravel_multi_index(cells.T, dims)
+
+def within_distance(src, dst, limit):
+    '''True if every point of src lies within limit of some point of dst,
+    i.e. the directed Hausdorff distance from src to dst is at most limit.
+
+    A src point that shares a cell of width limit / sqrt(3) with a dst point
+    is within limit. The other src points are compared with the dst points
+    in the 27 cells of width limit around them, which hold all points within
+    limit. Requires NumPy.
+    '''
+    src = np.asarray(src, dtype=np.float64).reshape(-1, 3)
+    dst = np.asarray(dst, dtype=np.float64).reshape(-1, 3)
+    if len(src) == 0:
+        return True
+    if len(dst) == 0:
+        return False
+    limit = max(limit, _EPS)
+    origin = np.minimum(src.min(axis=0), dst.min(axis=0))
+    src = src - origin
+    dst = dst - origin
+    extent = np.maximum(src.max(axis=0), dst.max(axis=0))
+    if float(np.prod(np.floor(extent * math.sqrt(3.0) / limit) + 3.0)) >= 2.0 ** 62:
+        # too many cells for integer keys
+        return _within_distance_blocks(src, dst, limit)
+
+    width = limit / math.sqrt(3.0)
+    src_cells = np.floor(src / width).astype(np.int64)
+    dst_cells = np.floor(dst / width).astype(np.int64)
+    dims = np.maximum(src_cells.max(axis=0), dst_cells.max(axis=0)) + 1
+    src = src[~np.isin(_cell_keys(src_cells, dims), _cell_keys(dst_cells, dims))]
+    if len(src) == 0:
+        return True
+
+    # cells shifted by one, so the neighbours of all cells have valid keys
+    src_cells = np.floor(src / limit).astype(np.int64) + 1
+    dst_cells = np.floor(dst / limit).astype(np.int64) + 1
+    dims = np.maximum(src_cells.max(axis=0), dst_cells.max(axis=0)) + 2
+    dst_keys = _cell_keys(dst_cells, dims)
+    order = np.argsort(dst_keys, kind='stable')
+    dst_keys = dst_keys[order]
+    dst = dst[order]
+    for start in range(0, len(src), _NEAREST_BLOCK):
+        block = src[start:start + _NEAREST_BLOCK]
+        block_cells = src_cells[start:start + _NEAREST_BLOCK]
+        nearest = np.full(len(block), np.inf)
+        for offset in itertools.product((-1, 0, 1), repeat=3):
+            keys = _cell_keys(block_cells + offset, dims)
+            first = np.searchsorted(dst_keys, keys, 'left')
+            counts = np.searchsorted(dst_keys, keys, 'right') - first
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # one pair per src point and dst point of its neighbour cell
+            pair_src = np.repeat(np.arange(len(block)), counts)
+            pair_dst = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(total)
+            squared = ((block[pair_src] - dst[pair_dst]) ** 2).sum(axis=1)
+            found = counts > 0
+            segments = np.concatenate(([0], np.cumsum(counts[found])[:-1]))
+            nearest[found] = np.minimum(nearest[found], np.minimum.reduceat(squared, segments))
+        if nearest.max() > limit * limit:
+            return False
+    return True
+
+def _within_distance_blocks(src, dst, limit):
+    # brute force of within_distance, in blocks of squared distances
+    dst_squared = (dst ** 2).sum(axis=1)
+    rows = max(1, _DISTANCE_BLOCK // len(dst))
+    for start in range(0, len(src), rows):
+        block = src[start:start + rows]
+        squared = (block ** 2).sum(axis=1)[:, None] + dst_squared - 2.0 * (block @ dst.T)
+        if squared.min(axis=1).max() > limit * limit:
+            return False
+    return True
+
+
+##############################################################################
+# Vectorized Metrics (NumPy)
+##############################################################################
+
+def metrics_from_buffers(vertex_counts, co, polygon_counts, areas):
+    '''Compute metric rows for many meshes from concatenated buffers.
+
+    vertex_counts: number of vertices per mesh
+    co: flat vertex coordinates of all meshes (x0, y0, z0, x1, ...)
+    polygon_counts: number of polygons per mesh
+    areas: polygon areas of all meshes
+
+    Returns a (n_meshes, len(METRIC_KEYS)) float64 array.
+    Meshes without vertices get all-zero rows.
+    '''
+    vertex_counts = np.asarray(vertex_counts, dtype=np.int64)
+    polygon_counts = np.asarray(polygon_counts, dtype=np.int64)
+    co = np.asarray(co).reshape(-1, 3)
+    n = len(vertex_counts)
+    rows = np.zeros((n, len(METRIC_KEYS)), dtype=np.float64)
+    rows[:, 0] = vertex_counts
+
+    has_verts = vertex_counts > 0
+    if has_verts.any():
+        starts = (np.cumsum(vertex_counts) - vertex_counts)[has_verts]
+        bb_min = np.minimum.reduceat(co, starts, axis=0)
+        bb_max = np.maximum.reduceat(co, starts, axis=0)
+        rows[has_verts, 1:7:2] = bb_min
+        rows[has_verts, 2:7:2] = bb_max
+        rows[:, 7] = np.prod(rows[:, 2:7:2] - rows[:, 1:7:2], axis=1)
+
+    has_polys = polygon_counts > 0
+    if has_polys.any():
+        starts = (np.cumsum(polygon_counts) - polygon_counts)[has_polys]
+        rows[has_polys, 8] = np.add.reduceat(areas, starts, dtype=np.float64)
+    return rows
+
+
+##############################################################################
+# Geometry Fingerprints
+##############################################################################
+
+_FINGERPRINT_SIZE = 16
+
+
+def geometry_fingerprint(co, loop_totals, loop_vertices, precision):
+    '''Return a digest of quantized vertex positions and polygon topology.
+
+    co: flat vertex coordinates (x0, y0, z0, x1, ...)
+    loop_totals: number of corners of every polygon
+    loop_vertices: vertex index of every polygon corner
+    precision: quantization step for the vertex coordinates
+
+    Meshes with the same vertex order, the same positions (within precision)
+    and the same polygons get the same fingerprint.
+    '''
+    digest = hashlib.blake2b(digest_size=_FINGERPRINT_SIZE)
+    if np is not None:
+        quantized = np.rint(np.asarray(co, dtype=np.float64) / precision).astype(np.int64)
+        loop_totals = np.asarray(loop_totals, dtype=np.int32)
+        loop_vertices = np.asarray(loop_vertices, dtype=np.int32)
+    else:
+        quantized = array.array('q', (round(v / precision) for v in co))
+        loop_totals = array.array('i', loop_totals)
+        loop_vertices = array.array('i', loop_vertices)
+    # counts first, so buffers of different meshes can not run into each other
+    digest.update(array.array('q', (len(quantized), len(loop_totals), len(loop_vertices))).tobytes())
+    digest.update(quantized.tobytes())
+    digest.update(loop_totals.tobytes())
+    digest.update(loop_vertices.tobytes())
+    return digest.digest()
+
+
+def fingerprint_all(buffers, precision, max_workers=None):
+    '''Fingerprint an iterable of (co, loop_totals, loop_vertices) buffers.
+
+    Hashing runs on a thread pool: NumPy and hashlib release the GIL while
+    working on large buffers, so the buffers of the next meshes can be read
+    while the previous ones are hashed.
+    Returns the fingerprints in input order.
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(geometry_fingerprint, co, loop_totals, loop_vertices, precision)
+            for co, loop_totals, loop_vertices in buffers
+            ]
+        return [f.result() for f in futures]
+
+
+def assembly_hash(node_key, children, precision):
+    '''Hash of a node of an object hierarchy from its own key (bytes) and
+    the (hash, relative transform) pairs of its children. The transforms
+    (16 floats) are quantized to precision and the children are sorted, so
+    the hash does not depend on the child order.
+
+    Computed bottom-up (post-order), identical hashes mark identical
+    sub-assemblies.
+    '''
+    entries = sorted(
+        child_hash + array.array('q', (round(v / precision) for v in transform)).tobytes()
+        for child_hash, transform in children
+        )
+    h = hashlib.blake2b(node_key, digest_size=16)
+    h.update(len(entries).to_bytes(8, 'little'))
+    for entry in entries:
+        h.update(entry)
+    return h.digest()
+
+
+##############################################################################
+# Pose-Normalized Descriptors
+##############################################################################
+
+# Columns of a pose descriptor row
+POSE_KEYS = (
+    'vertex_count',
+    'sigma_1',
+    'sigma_2',
+    'sigma_3',
+    'radius_max',
+    'radius_mean',
+    'chirality',
+)
+POSE_KEY_COLUMNS = (0, 1, 4)
+POSE_CHIRALITY_COLUMN = 6
+
+# Below these relative values principal axes or their orientation are not
+# well defined, and the chirality is reported as 0 (undetermined)
+_AXIS_GAP = 1e-3
+_SKEW_MIN = 1e-3
+
+
+def pose_descriptors(vertex_counts, co):
+    '''Compute rotation and translation invariant descriptors for many meshes.
+
+    vertex_counts: number of vertices per mesh
+    co: flat vertex coordinates of all meshes
+
+    Every row holds the vertex count, the standard deviations along the
+    principal axes (sorted, largest first), the maximum and mean distance
+    of the vertices from the centroid and the chirality: the principal axes
+    are oriented by the sign of the third moment (skewness) along them, and
+    the handedness of the oriented frame (+1 or -1) tells mirror images
+    apart. It is 0 if the frame is not well defined (symmetric parts).
+    Returns a (n_meshes, len(POSE_KEYS)) float64 array.
+    '''
+    vertex_counts = np.asarray(vertex_counts, dtype=np.int64)
+    points = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    n = len(vertex_counts)
+    rows = np.zeros((n, len(POSE_KEYS)), dtype=np.float64)
+    rows[:, 0] = vertex_counts
+
+    has_verts = vertex_counts > 0
+    if not has_verts.any():
+        return rows
+    counts = vertex_counts[has_verts]
+    starts = np.cumsum(vertex_counts)[has_verts] - counts
+    centroids = np.add.reduceat(points, starts, axis=0) / counts[:, None]
+    centered = points - np.repeat(centroids, counts, axis=0)
+
+    # per mesh covariance matrices, one product at a time to limit temporary memory
+    covariance = np.empty((len(counts), 3, 3), dtype=np.float64)
+    for a, b in ((0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2)):
+        covariance[:, a, b] = np.add.reduceat(centered[:, a] * centered[:, b], starts) / counts
+        covariance[:, b, a] = covariance[:, a, b]
+    eigenvalues, axes = np.linalg.eigh(covariance)
+    sigmas = np.sqrt(np.clip(eigenvalues[:, ::-1], 0.0, None))
+    rows[has_verts, 1:4] = sigmas
+    rows[has_verts, 6] = _chirality(centered, starts, counts, eigenvalues, axes[:, :, ::-1], sigmas)
+
+    radii = np.linalg.norm(centered, axis=1)
+    rows[has_verts, 4] = np.maximum.reduceat(radii, starts)
+    rows[has_verts, 5] = np.add.reduceat(radii, starts) / counts
+    return rows
+
+
+def _chirality(centered, starts, counts, eigenvalues, axes, sigmas):
+    # third moments M_ijk per mesh, one product at a time like the covariance
+    moments = np.empty((len(counts), 3, 3, 3), dtype=np.float64)
+    for i, j, k in itertools.combinations_with_replacement(range(3), 3):
+        value = np.add.reduceat(centered[:, i] * centered[:, j] * centered[:, k], starts) / counts
+        for a, b, c in set(itertools.permutations((i, j, k))):
+            moments[:, a, b, c] = value
+    # skewness along every principal axis (axes are the columns)
+    skew = np.einsum('nijk,nia,nja,nka->na', moments, axes, axes, axes)
+    signs = np.sign(skew)
+    signs[np.abs(skew) < _SKEW_MIN * np.maximum(sigmas, _EPS) ** 3] = 0.0
+    oriented = axes * signs[:, None, :]
+    chirality = np.sign(np.linalg.det(oriented))
+
+    # equal eigenvalues leave the axes free to rotate
+    gaps = np.diff(eigenvalues, axis=1).min(axis=1)
+    chirality[gaps < _AXIS_GAP * np.maximum(eigenvalues[:, -1], _EPS)] = 0.0
+    return chirality
+
+
+def rigid_transform(src, dst, allow_reflection=False):
+    '''Find the rotation and translation mapping the points src onto dst.
+    With allow_reflection, the transform may also mirror the points
+    (negative determinant).
+
+    Points are matched by index (Kabsch algorithm).
+    Returns the 4x4 transform and the largest remaining point distance.
+    '''
+    src = np.asarray(src, dtype=np.float64).reshape(-1, 3)
+    dst = np.asarray(dst, dtype=np.float64).reshape(-1, 3)
+    src_center = src.mean(axis=0)
+    dst_center = dst.mean(axis=0)
+    h = (src - src_center).T @ (dst - dst_center)
+    u, _, vt = np.linalg.svd(h)
+    d = 1.0 if allow_reflection else np.sign(np.linalg.det(vt.T @ u.T)) or 1.0
+    rotation = vt.T @ np.diag((1.0, 1.0, d)) @ u.T
+    translation = dst_center - rotation @ src_center
+
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = translation
+    residual = np.linalg.norm(src @ rotation.T + translation - dst, axis=1).max(initial=0.0)
+    return matrix, float(residual)
+
+
+def split_by_rigid_match(points, tolerance, allow_reflection=False):
+    '''Split a list of point arrays into groups related by rigid transforms
+    (and reflections, with allow_reflection).
+
+    Every point array is matched against the representative (first member)
+    of the existing groups. It joins the first group whose representative
+    it matches within tolerance, otherwise it starts a new group.
+
+    Returns a list of groups, each a list of (index, matrix) pairs where
+    matrix maps the representative's points onto the member's points.
+    '''
+    groups = []
+    for i, pts in enumerate(points):
+        for group in groups:
+            rep = points[group[0][0]]
+            if len(rep) != len(pts):
+                continue
+            matrix, residual = rigid_transform(rep, pts, allow_reflection)
+            if residual <= tolerance:
+                group.append((i, matrix))
+                break
+        else:
+            groups.append([(i, np.identity(4))])
+    return groups
+
+
+##############################################################################
+# Shape Similarity
+##############################################################################
+
+# Columns of a shape descriptor row: log10 of the largest principal extent,
+# the other two extents relative to it, the surface area relative to the
+# largest extent squared, then the D2 shape distribution histogram.
+SHAPE_SIZE_COLUMN = 0
+SHAPE_BINS = 16
+SHAPE_COLUMNS = 4 + SHAPE_BINS
+
+# Random vertex pairs sampled per mesh for the D2 histogram
+_SHAPE_PAIRS = 4096
+
+
+def shape_descriptors(vertex_counts, co, polygon_counts, areas):
+    '''Compute pose-invariant shape descriptors for many meshes.
+
+    The extents are measured along the principal axes of the vertices.
+    The D2 histogram is the distribution of distances between random
+    vertex pairs, relative to the diagonal of the principal extents. The
+    pairs are drawn with a per-mesh seed, so a mesh always gets the same
+    descriptor, however the meshes are batched.
+    Returns a (n_meshes, SHAPE_COLUMNS) float64 array.
+    '''
+    vertex_counts = np.asarray(vertex_counts, dtype=np.int64)
+    polygon_counts = np.asarray(polygon_counts, dtype=np.int64)
+    points = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    n = len(vertex_counts)
+    rows = np.zeros((n, SHAPE_COLUMNS), dtype=np.float64)
+
+    surface = np.zeros(n, dtype=np.float64)
+    has_polys = polygon_counts > 0
+    if has_polys.any():
+        starts = (np.cumsum(polygon_counts) - polygon_counts)[has_polys]
+        surface[has_polys] = np.add.reduceat(areas, starts, dtype=np.float64)
+
+    ends = np.cumsum(vertex_counts)
+    for i in range(n):
+        count = int(vertex_counts[i])
+        if count == 0:
+            continue
+        pts = points[ends[i] - count:ends[i]]
+        centered = pts - pts.mean(axis=0)
+        _, axes = np.linalg.eigh(centered.T @ centered)
+        projected = centered @ axes
+        extents = np.sort(projected.max(axis=0) - projected.min(axis=0))[::-1]
+        largest = max(extents[0], _EPS)
+        rows[i, 0] = math.log10(largest)
+        rows[i, 1:3] = extents[1:] / largest
+        rows[i, 3] = surface[i] / (largest * largest)
+
+        rng = np.random.default_rng(count)
+        a = rng.integers(0, count, _SHAPE_PAIRS)
+        b = rng.integers(0, count, _SHAPE_PAIRS)
+        distances = np.linalg.norm(pts[a] - pts[b], axis=1) / max(np.linalg.norm(extents), _EPS)
+        histogram, _ = np.histogram(distances, bins=SHAPE_BINS, range=(0.0, 1.0))
+        rows[i, 4:] = histogram / _SHAPE_PAIRS
+    return rows
+
+
+def nearest_rows(rows, query, k, weights=None):
+    '''Return the indices and distances of the k rows nearest to query,
+    nearest first. Columns are scaled by their standard deviation over
+    rows (and optional weights), so all descriptor parts count alike.'''
+    scale = rows.std(axis=0)
+    scale[scale < _EPS] = 1.0
+    if weights is not None:
+        scale = scale / np.maximum(weights, _EPS)
+    distances = np.linalg.norm((rows - query) / scale, axis=1)
+    k = min(k, len(rows))
+    if k <= 0:
+        return [], []
+    nearest = np.argpartition(distances, k - 1)[:k]
+    nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+    return nearest.tolist(), distances[nearest].tolist()
+
+
+##############################################################################
+# Coincident Boxes
+##############################################################################
+
+def coincident_groups(boxes, tolerance):
+    '''Group axis-aligned boxes (min x, y, z, max x, y, z) whose corners
+    coincide within tolerance, in linear time.
+
+    Box centres are hashed into a grid with a cell width of twice the
+    tolerance, so a matching representative lies in the cell of a centre or
+    in its nearest neighbour cell on every axis (8 cells to look up).
+    Returns lists of box indices, only groups of more than one box.
+    '''
+    width = 2.0 * max(tolerance, _EPS)
+    grid = {}
+    groups = []
+    for i, box in enumerate(boxes):
+        cells = []
+        for axis in range(3):
+            pos = 0.5 * (box[axis] + box[axis + 3]) / width
+            cell = math.floor(pos)
+            cells.append((cell, cell - 1) if pos - cell < 0.5 else (cell, cell + 1))
+        found = None
+        for key in itertools.product(*cells):
+            for group in grid.get(key, ()):
+                rep = boxes[group[0]]
+                if all(abs(a - b) <= tolerance for a, b in zip(box, rep)):
+                    found = group
+                    break
+            if found is not None:
+                break
+        if found is None:
+            group = [i]
+            groups.append(group)
+            grid.setdefault(tuple(c[0] for c in cells), []).append(group)
+        else:
+            found.append(i)
+    return [group for group in groups if len(group) > 1]
+
+
+##############################################################################
+# Batch Computation
+##############################################################################
+
+def compute_descriptors(kind, buffers, counts, precision=None):
+    '''Compute the descriptors of kind for a batch of meshes.
+
+    kind: 'metrics', 'pose', 'shape' or 'fingerprint'
+    buffers: concatenated per-mesh buffers, in the order used by the kind:
+        metrics, shape: vertex coordinates, polygon areas
+        pose: vertex coordinates
+        fingerprint: vertex coordinates, polygon sizes, corner vertex indices
+    counts: number of elements (vertices, polygons, ...) per mesh and buffer
+    precision: quantization step (fingerprint only)
+
+    Returns a list with one descriptor (row tuple or digest) per mesh.
+    '''
+    if kind == 'metrics':
+        rows = metrics_from_buffers(counts[0], buffers[0], counts[1], buffers[1])
+        return [tuple(row) for row in rows.tolist()]
+    if kind == 'pose':
+        return [tuple(row) for row in pose_descriptors(counts[0], buffers[0]).tolist()]
+    if kind == 'shape':
+        rows = shape_descriptors(counts[0], buffers[0], counts[1], buffers[1])
+        return [tuple(row) for row in rows.tolist()]
+    if kind == 'fingerprint':
+        co, loop_totals, loop_vertices = buffers
+        v_counts, p_counts, l_counts = (np.asarray(c, dtype=np.int64) for c in counts)
+        v_ends = np.cumsum(v_counts) * 3
+        p_ends = np.cumsum(p_counts)
+        l_ends = np.cumsum(l_counts)
+        fingerprints = []
+        for i in range(len(v_counts)):
+            fingerprints.append(geometry_fingerprint(
+                co[v_ends[i] - v_counts[i] * 3:v_ends[i]],
+                loop_totals[p_ends[i] - p_counts[i]:p_ends[i]],
+                loop_vertices[l_ends[i] - l_counts[i]:l_ends[i]],
+                precision,
+                ))
+        return fingerprints
+    raise ValueError(f'Unknown descriptor kind: {kind}')
+
+
+def balanced_chunks(weights, n_chunks):
+    '''Split range(len(weights)) into up to n_chunks contiguous (start, end)
+    ranges of roughly equal total weight.'''
+    if len(weights) == 0:
+        return []
+    cumulative = np.cumsum(np.asarray(weights, dtype=np.float64) + 1.0)
+    targets = np.linspace(0.0, cumulative[-1], n_chunks + 1)[1:-1]
+    bounds = np.searchsorted(cumulative, targets, side='right')
+    edges = np.unique(np.concatenate(([0], bounds, [len(weights)])))
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def descriptor_worker(kind, shm_name, layout, counts, starts, precision):
+    '''Compute descriptors for a chunk of meshes in a worker process.
+
+    The buffers of all meshes are stored in the shared memory block shm_name,
+    described by layout: one (dtype, byte offset, values per element) entry
+    per buffer. counts holds the per-mesh element counts of the chunk and
+    starts the index of its first element in every buffer.
+    '''
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffers = []
+        for (dtype, offset, items), chunk_counts, start in zip(layout, counts, starts):
+            dtype = np.dtype(dtype)
+            buffers.append(np.ndarray(
+                sum(chunk_counts) * items,
+                dtype=dtype,
+                buffer=block.buf,
+                offset=offset + start * items * dtype.itemsize,
+                ))
+        result = compute_descriptors(kind, buffers, counts, precision)
+        # views must be released before the block can be closed
+        del buffers
+        return result
+    finally:
+        block.close()
@@ -1,5 +1,12 @@
 # GPL-3.0 license
 import bpy
+import array
+import mathutils
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def get_material_list(context):
@@ -31,7 +38,427 @@ def report_error(op, message: str):
     report(op, 'ERROR', message)
 
 
+# Hierarchy helpers. Object.children scans all objects on every access, so
+# for bulk operations the parent -> children map is built once.
+def children_map(objects):
+    """Return a dict of object -> list of its children among objects."""
+    children = {ob: [] for ob in objects}
+    for ob in objects:
+        if ob.parent in children:
+            children[ob.parent].append(ob)
+    return children
+
+def topmost_objects(objects):
+    """Return the objects that have no ancestor among objects."""
+    object_set = set(objects)
+    topmost = []
+    for ob in objects:
+        parent = ob.parent
+        while parent is not None and parent not in object_set:
+            parent = parent.parent
+        if parent is None:
+            topmost.append(ob)
+    return topmost
+
+def subtree(ob, children):
+    """Return ob and all its descendants (pre-order) using a children map."""
+    objects = []
+    stack = [ob]
+    while stack:
+        ob = stack.pop()
+        objects.append(ob)
+        stack.extend(children.get(ob, ()))
+    return objects
+
+# Re-parenting engine. Blender only updates matrix_world on the next
+# depsgraph evaluation, so all matrices are read before anything changes and
+# the new ones are computed for all objects at once.
+def reparent(objects, parents, worlds=None):
+    """Re-parent every object to the matching entry of parents (None for no
+    parent), keeping its world placement.
+
+    The local transform (matrix_basis) is kept, the placement is kept by
+    matrix_parent_inverse = inverse(new parent world) @ old parent frame.
+    Objects that end up without a parent get their world matrix as basis.
+    worlds: optional dict of parent -> world matrix it is about to get
+    (see set_world_matrices).
+    """
+    objects = list(objects)
+    parents = list(parents)
+    if not objects:
+        return
+    worlds = worlds or {}
+    frames = parent_frames(objects)
+    if np is None:
+        for ob, parent, frame in zip(objects, parents, frames):
+            world = mathutils.Matrix.Identity(4) if parent is None else worlds.get(parent, parent.matrix_world)
+            _set_parent(ob, parent, world.inverted_safe() @ frame, frame @ ob.matrix_basis)
+        return
+
+    owners = list({parent for parent in parents if parent is not None})
+    row = {parent: i + 1 for i, parent in enumerate(owners)}
+    # row 0 (no parent) is the identity
+    inverses = _inverse(_stack(
+        [mathutils.Matrix.Identity(4)] + [worlds.get(p, p.matrix_world) for p in owners]
+        ))
+    rows = np.array([row.get(parent, 0) for parent in parents], dtype=np.int64)
+    parent_inverses = inverses[rows] @ frames
+    bases = frames @ _stack(ob.matrix_basis for ob in objects)
+    for ob, parent, parent_inverse, basis in zip(objects, parents, parent_inverses.tolist(), bases.tolist()):
+        _set_parent(ob, parent, mathutils.Matrix(parent_inverse), mathutils.Matrix(basis))
+
+def set_world_matrices(objects, worlds):
+    """Move every object to the matching world matrix (through its
+    matrix_basis). Their children keep their placement: their parent
+    inverse matrices are compensated in one batch."""
+    objects = list(objects)
+    worlds = list(worlds)
+    if not objects:
+        return
+    # read before the parent inverse of moved objects below moved parents changes
+    frames = parent_frames(objects)
+    moved = dict(zip(objects, worlds))
+    children = [ob for ob in bpy.data.objects if ob.parent in moved]
+    reparent(children, [ob.parent for ob in children], moved)
+    if np is None:
+        bases = [frame.inverted_safe() @ world for frame, world in zip(frames, worlds)]
+    else:
+        bases = [mathutils.Matrix(m) for m in (_inverse(frames) @ _stack(worlds)).tolist()]
+    for ob, basis in zip(objects, bases):
+        ob.matrix_basis = basis
+
+def parent_frames(objects):
+    """The frames the local transforms of objects are relative to
+    (world = frame @ basis), as an (n, 4, 4) array (list of matrices
+    without NumPy)."""
+    worlds = {}
+    frames = []
+    for ob in objects:
+        parent = ob.parent
+        if parent is None:
+            frames.append(mathutils.Matrix.Identity(4))
+        elif ob.parent_type == 'OBJECT':
+            if parent not in worlds:
+                worlds[parent] = parent.matrix_world.copy()
+            frames.append(worlds[parent] @ ob.matrix_parent_inverse)
+        else:
+            # bone or vertex parents
+            frames.append(ob.matrix_world @ ob.matrix_basis.inverted_safe())
+    if np is None:
+        return frames
+    return _stack(frames)
+
+def _set_parent(ob, parent, parent_inverse, basis):
+    ob.parent = parent
+    ob.parent_type = 'OBJECT'
+    if parent is None:
+        ob.matrix_parent_inverse = mathutils.Matrix.Identity(4)
+        ob.matrix_basis = basis
+    else:
+        ob.matrix_parent_inverse = parent_inverse
+
+def _stack(matrices):
+    return np.array([m for m in matrices], dtype=np.float64).reshape(-1, 4, 4)
+
+def _inverse(matrices):
+    try:
+        return np.linalg.inv(matrices)
+    except np.linalg.LinAlgError:
+        # e.g. a parent scaled to zero
+        return np.linalg.pinv(matrices)
+
+def delete_and_reparent(objects):
+    """Delete objects with a single batch_remove call. Their remaining
+    children are re-parented to the nearest remaining ancestor (or to no
+    parent) and keep their world placement.
+    Returns the number of re-parented children."""
+    doomed = set(objects)
+    survivors = {}
+
+    def surviving_ancestor(ob):
+        chain = []
+        while ob in doomed and ob not in survivors:
+            chain.append(ob)
+            ob = ob.parent
+        ancestor = survivors.get(ob, ob)
+        for link in chain:
+            survivors[link] = ancestor
+        return ancestor
+
+    children = [ob for ob in bpy.data.objects if ob.parent in doomed and ob not in doomed]
+    reparent(children, [surviving_ancestor(ob.parent) for ob in children])
+    bpy.data.batch_remove(list(doomed))
+    return len(children)
+
+# Mesh buffers, read with foreach_get into NumPy arrays (array.array
+# without NumPy).
+def get_mesh_coordinates(mesh):
+    """Read the vertex coordinates of a mesh as an (n, 3) array
+    (list of tuples without NumPy)."""
+    if np is not None:
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        return co.reshape(-1, 3)
+    co = array.array('f', [0.0]) * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', co)
+    return list(zip(co[0::3], co[1::3], co[2::3]))
+
+def get_mesh_buffers(mesh):
+    """Read vertex coordinates, polygon sizes and corner vertex indices
+    of a mesh with foreach_get."""
+    n_verts = len(mesh.vertices)
+    n_polys = len(mesh.polygons)
+    n_loops = len(mesh.loops)
+    if np is not None:
+        co = np.empty(n_verts * 3, dtype=np.float32)
+        loop_totals = np.empty(n_polys, dtype=np.int32)
+        loop_vertices = np.empty(n_loops, dtype=np.int32)
+    else:
+        co = array.array('f', [0.0]) * (n_verts * 3)
+        loop_totals = array.array('i', [0]) * n_polys
+        loop_vertices = array.array('i', [0]) * n_loops
+    mesh.vertices.foreach_get('co', co)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    return co, loop_totals, loop_vertices
+
+# Data-level join. The evaluated geometry (modifiers applied) of every part
+# is read with foreach_get, moved into the space of the target object and
+# concatenated in NumPy, then written to one new mesh with foreach_set.
+# No operators are called, so it works without a UI context.
+_JOIN_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}
+
+# attribute data type -> (foreach property, components, NumPy type)
+_ATTRIBUTE_LAYOUT = {
+    'FLOAT': ('value', 1, 'float32'),
+    'INT': ('value', 1, 'int32'),
+    'INT8': ('value', 1, 'int8'),
+    'BOOLEAN': ('value', 1, 'bool'),
+    'FLOAT2': ('vector', 2, 'float32'),
+    'INT16_2D': ('value', 2, 'int16'),
+    'INT32_2D': ('value', 2, 'int32'),
+    'FLOAT_VECTOR': ('vector', 3, 'float32'),
+    'FLOAT_COLOR': ('color', 4, 'float32'),
+    'BYTE_COLOR': ('color', 4, 'float32'),
+    'QUATERNION': ('value', 4, 'float32'),
+    'FLOAT4X4': ('value', 16, 'float32'),
+}
+# attributes written from the dedicated arrays below, not generically
+_JOIN_BUILTIN = {'position', 'material_index', 'sharp_face', 'custom_normal'}
+
 def apply_modifiers_and_join(context, objects_list):
+    """Join the geometry of all mesh, curve, surface, text and metaball
+    objects of objects_list, with their modifiers applied, into the first
+    mesh object (a new mesh object if there is none). The joined objects are
+    deleted; other objects are kept.
+
+    Vertex positions, edges, faces, smooth shading, UV maps, material
+    slots, custom normals and the generic attributes of all domains (sharp
+    edges, creases, color attributes, ...) are kept; parts without an
+    attribute get zeros. Vertex groups and shape keys are lost.
+    Returns the joined object, or None if there was nothing to join.
+    """
+    if np is None:
+        return _join_with_operators(context, objects_list)
+    parts = [ob for ob in objects_list if ob.type in _JOIN_TYPES]
+    if not parts:
+        return None
+    target = next((ob for ob in parts if ob.type == 'MESH'), None)
+
+    depsgraph = context.evaluated_depsgraph_get()
+    reference = parts[0] if target is None else target
+    to_target = np.linalg.inv(np.array(reference.matrix_world, dtype=np.float64))
+    materials = []
+    geometry = []
+    for ob in parts:
+        slots = [slot.material for slot in ob.material_slots] or [None]
+        for material in slots:
+            if material not in materials:
+                materials.append(material)
+        remap = np.array([materials.index(material) for material in slots], dtype=np.int32)
+        data = _read_evaluated_mesh(ob, depsgraph)
+        if data is not None:
+            _transform_mesh_data(data, to_target @ np.array(ob.matrix_world, dtype=np.float64))
+            data['material_index'] = remap[np.clip(data['material_index'], 0, len(remap) - 1)]
+            geometry.append(data)
+
+    mesh = bpy.data.meshes.new(reference.data.name if target is not None else reference.name)
+    _write_mesh_data(mesh, geometry)
+    if any(material is not None for material in materials):
+        for material in materials:
+            mesh.materials.append(material)
+
+    if target is None:
+        target = bpy.data.objects.new(reference.name, mesh)
+        for collection in reference.users_collection:
+            collection.objects.link(target)
+        target.parent = reference.parent
+        target.matrix_parent_inverse = reference.matrix_parent_inverse.copy()
+        target.matrix_basis = reference.matrix_basis.copy()
+    else:
+        old_data = target.data
+        target.data = mesh
+        target.modifiers.clear()
+        if old_data.users == 0:
+            bpy.data.meshes.remove(old_data)
+    for slot in target.material_slots:
+        slot.link = 'DATA'
+
+    joined = [ob for ob in parts if ob != target]
+    old_data = {ob.data.as_pointer(): ob.data for ob in joined if ob.data is not None}
+    delete_and_reparent(joined)
+    unused = [data for data in old_data.values() if data.users == 0]
+    if unused:
+        bpy.data.batch_remove(unused)
+    return target
+
+def _read_evaluated_mesh(ob, depsgraph):
+    """Read the evaluated geometry of ob into a dict of NumPy arrays."""
+    ob_eval = ob.evaluated_get(depsgraph)
+    mesh = ob_eval.to_mesh()
+    try:
+        if mesh is None or len(mesh.vertices) == 0:
+            return None
+        data = {
+            'co': np.empty(len(mesh.vertices) * 3, dtype=np.float32),
+            'edges': np.empty(len(mesh.edges) * 2, dtype=np.int32),
+            'vertex_index': np.empty(len(mesh.loops), dtype=np.int32),
+            'edge_index': np.empty(len(mesh.loops), dtype=np.int32),
+            'loop_start': np.empty(len(mesh.polygons), dtype=np.int32),
+            'loop_total': np.empty(len(mesh.polygons), dtype=np.int32),
+            'material_index': np.empty(len(mesh.polygons), dtype=np.int32),
+            'use_smooth': np.empty(len(mesh.polygons), dtype=bool),
+            'uv': {},
+            'attributes': {},
+            'normals': np.empty(len(mesh.loops) * 3, dtype=np.float32),
+            'custom_normals': mesh.has_custom_normals,
+        }
+        mesh.vertices.foreach_get('co', data['co'])
+        mesh.edges.foreach_get('vertices', data['edges'])
+        mesh.loops.foreach_get('vertex_index', data['vertex_index'])
+        mesh.loops.foreach_get('edge_index', data['edge_index'])
+        for name in ('loop_start', 'loop_total', 'material_index', 'use_smooth'):
+            mesh.polygons.foreach_get(name, data[name])
+        for layer in mesh.uv_layers:
+            uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            layer.uv.foreach_get('vector', uv)
+            data['uv'][layer.name] = uv
+        for attribute in mesh.attributes:
+            name = attribute.name
+            layout = _ATTRIBUTE_LAYOUT.get(attribute.data_type)
+            if layout is None or name.startswith('.') or name in _JOIN_BUILTIN or name in data['uv']:
+                continue
+            prop, components, dtype = layout
+            values = np.empty(len(attribute.data) * components, dtype=dtype)
+            attribute.data.foreach_get(prop, values)
+            data['attributes'][name] = (attribute.domain, attribute.data_type, values)
+        # parts without custom normals keep their automatic ones in the join
+        mesh.corner_normals.foreach_get('vector', data['normals'])
+        return data
+    finally:
+        ob_eval.to_mesh_clear()
+
+def _transform_mesh_data(data, matrix):
+    """Transform the vertices and corner normals of mesh data in place. A
+    mirroring transform also reverses the corner order of every face, so
+    normals stay outside."""
+    co = data['co'].reshape(-1, 3).astype(np.float64)
+    data['co'] = (co @ matrix[:3, :3].T + matrix[:3, 3]).astype(np.float32).ravel()
+    normals = data['normals'].reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    data['normals'] = (normals / np.where(lengths > 0.0, lengths, 1.0)).astype(np.float32).ravel()
+    if np.linalg.det(matrix[:3, :3]) >= 0.0 or len(data['vertex_index']) == 0:
+        return
+    starts = np.repeat(data['loop_start'], data['loop_total'])
+    totals = np.repeat(data['loop_total'], data['loop_total'])
+    position = np.arange(len(starts)) - starts
+    # keep the first corner, reverse the others; corner k's edge leads to corner k + 1
+    vertex_source = starts + (-position) % totals
+    edge_source = starts + (totals - 1 - position)
+    data['vertex_index'] = data['vertex_index'][vertex_source]
+    data['edge_index'] = data['edge_index'][edge_source]
+    data['uv'] = {
+        name: uv.reshape(-1, 2)[vertex_source].ravel()
+        for name, uv in data['uv'].items()
+        }
+    for name, (domain, data_type, values) in data['attributes'].items():
+        if domain == 'CORNER':
+            values = values.reshape(len(starts), -1)[vertex_source].ravel()
+            data['attributes'][name] = (domain, data_type, values)
+    data['normals'] = data['normals'].reshape(-1, 3)[vertex_source].ravel()
+
+def _write_mesh_data(mesh, geometry):
+    """Concatenate the mesh data of all parts into mesh."""
+    n_vertices = [len(data['co']) // 3 for data in geometry]
+    n_edges = [len(data['edges']) // 2 for data in geometry]
+    n_loops = [len(data['vertex_index']) for data in geometry]
+    vertex_offsets = np.cumsum([0] + n_vertices[:-1])
+    edge_offsets = np.cumsum([0] + n_edges[:-1])
+    loop_offsets = np.cumsum([0] + n_loops[:-1])
+
+    def concatenate(name, offsets=None, dtype=np.int32):
+        if not geometry:
+            return np.empty(0, dtype=dtype)
+        if offsets is None:
+            return np.concatenate([data[name] for data in geometry]).astype(dtype)
+        return np.concatenate([data[name] + offset for data, offset in zip(geometry, offsets)]).astype(dtype)
+
+    mesh.vertices.add(sum(n_vertices))
+    mesh.edges.add(sum(n_edges))
+    mesh.loops.add(sum(n_loops))
+    mesh.polygons.add(sum(len(data['loop_start']) for data in geometry))
+    mesh.vertices.foreach_set('co', concatenate('co', dtype=np.float32))
+    mesh.edges.foreach_set('vertices', concatenate('edges', vertex_offsets))
+    mesh.loops.foreach_set('vertex_index', concatenate('vertex_index', vertex_offsets))
+    mesh.loops.foreach_set('edge_index', concatenate('edge_index', edge_offsets))
+    mesh.polygons.foreach_set('loop_start', concatenate('loop_start', loop_offsets))
+    mesh.polygons.foreach_set('material_index', concatenate('material_index'))
+    mesh.polygons.foreach_set('use_smooth', concatenate('use_smooth', dtype=bool))
+
+    names = []
+    for data in geometry:
+        names.extend(name for name in data['uv'] if name not in names)
+    for name in names:
+        # parts without this UV map get (0, 0)
+        uv = np.concatenate([
+            data['uv'].get(name, np.zeros(n * 2, dtype=np.float32))
+            for data, n in zip(geometry, n_loops)
+            ])
+        mesh.uv_layers.new(name=name).uv.foreach_set('vector', uv)
+
+    sizes = {
+        'POINT': n_vertices,
+        'EDGE': n_edges,
+        'FACE': [len(data['loop_start']) for data in geometry],
+        'CORNER': n_loops,
+        }
+    layouts = {}
+    for data in geometry:
+        for name, (domain, data_type, _values) in data['attributes'].items():
+            layouts.setdefault(name, (domain, data_type))
+    for name, (domain, data_type) in layouts.items():
+        prop, components, dtype = _ATTRIBUTE_LAYOUT[data_type]
+        # parts without this attribute (or with another type) get zeros
+        values = np.concatenate([
+            data['attributes'][name][2]
+            if data['attributes'].get(name, (None, None))[:2] == (domain, data_type)
+            else np.zeros(n * components, dtype=dtype)
+            for data, n in zip(geometry, sizes[domain])
+            ])
+        attribute = mesh.attributes.get(name)
+        if attribute is None:
+            attribute = mesh.attributes.new(name, data_type, domain)
+        elif (attribute.domain, attribute.data_type) != (domain, data_type):
+            continue
+        attribute.data.foreach_set(prop, values)
+
+    mesh.validate()
+    if any(data['custom_normals'] for data in geometry) and len(mesh.loops) == sum(n_loops):
+        mesh.normals_split_custom_set(concatenate('normals', dtype=np.float32).reshape(-1, 3))
+    mesh.update()
+
+def _join_with_operators(context, objects_list):
+    # fallback without NumPy
     bpy.ops.object.select_all(action='DESELECT')
     for obj in objects_list:
         obj.select_set(True)
@@ -44,10 +471,9 @@ def apply_modifiers_and_join(context, objects_list):
     )
     try:
         bpy.ops.object.convert(target='MESH')
-    except:
+    except RuntimeError:
         pass
     bpy.ops.object.modifier_apply(modifier="ALL")
     bpy.ops.object.join()
 
-    return 0
-
+    return context.view_layer.objects.active